@@ -0,0 +1,64 @@
+"""Compare matching list members against CRM emails with `isin` and the CRM index.
+
+Run with:
+
+    python benchmarks/benchmark_crm_matching.py --sizes 100000 1000000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from mailchimp_api.processing.crm_emails import CrmEmailIndex
+
+PAGE_SIZE = 1000
+
+
+def _isin_match(crm_emails: pd.Series, members_pages: list[pd.Series]) -> int:
+    # the implementation replaced by the CRM index, exact strings only
+    unique_emails = crm_emails.unique()
+    return sum(int(page.isin(unique_emails).sum()) for page in members_pages)
+
+
+def _index_match(crm_emails: pd.Series, members_pages: list[pd.Series]) -> int:
+    crm_email_index = CrmEmailIndex(crm_emails)
+    return sum(int(crm_email_index.match(page).sum()) for page in members_pages)
+
+
+def _create_emails(size: int) -> tuple[pd.Series, list[pd.Series]]:
+    # every other list member is in the CRM
+    crm_emails = pd.Series([f"member-{i}@example.com" for i in range(0, size, 2)])
+    members_emails = pd.Series([f"member-{i}@example.com" for i in range(size)])
+    members_pages = [
+        members_emails.iloc[offset : offset + PAGE_SIZE].reset_index(drop=True)
+        for offset in range(0, size, PAGE_SIZE)
+    ]
+    return crm_emails, members_pages
+
+
+def _timeit(func, *args):  # type: ignore[no-untyped-def]
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'members':>10} {'isin [s]':>10} {'index [s]':>11} {'speedup':>9}")
+    for size in args.sizes:
+        crm_emails, members_pages = _create_emails(size)
+        old_time, old_result = _timeit(_isin_match, crm_emails, members_pages)
+        new_time, new_result = _timeit(_index_match, crm_emails, members_pages)
+        assert old_result == new_result
+
+        print(
+            f"{size:>10} {old_time:>10.3f} {new_time:>11.3f} {old_time / new_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare the memory used by members in a DataFrame of tag dicts and in MemberTags.
+
+Both representations are built page by page from generated API responses, the
+pages are released after they have been converted. Run with:
+
+    python benchmarks/benchmark_member_memory.py --size 1000000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from collections.abc import Iterator
+from typing import Any
+
+import pandas as pd
+
+from mailchimp_api.processing.member_tags import MemberTags, TagVocabulary
+
+TAGS = ["M1", "M2", "M3", "Test API Tag", "newsletter", "customer"]
+PAGE_SIZE = 1000
+
+
+def _iter_pages(size: int, seed: int = 42) -> Iterator[list[dict[str, Any]]]:
+    rng = random.Random(seed)
+    for offset in range(0, size, PAGE_SIZE):
+        yield [
+            {
+                "id": f"member-{i}",
+                "email_address": f"member-{i}@example.com",
+                "tags": [
+                    {"id": TAGS.index(name), "name": name}
+                    for name in rng.sample(TAGS, rng.randint(0, 3))
+                ],
+            }
+            for i in range(offset, min(offset + PAGE_SIZE, size))
+        ]
+
+
+def _build_dataframe(size: int) -> pd.DataFrame:
+    # the representation replaced by MemberTags
+    return pd.concat(
+        [pd.DataFrame(page)[["id", "tags"]] for page in _iter_pages(size)],
+        ignore_index=True,
+    )
+
+
+def _build_member_tags(size: int) -> list[MemberTags]:
+    vocabulary = TagVocabulary()
+    return [MemberTags.from_members(page, vocabulary) for page in _iter_pages(size)]
+
+
+def _measure(func, size):  # type: ignore[no-untyped-def]
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(size)
+    duration = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return duration, retained / 2**20, peak / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(
+        f"{'representation':>16} {'time [s]':>10} {'retained [MiB]':>16} {'peak [MiB]':>12}"
+    )
+    for name, func in [
+        ("DataFrame", _build_dataframe),
+        ("MemberTags", _build_member_tags),
+    ]:
+        duration, retained, peak = _measure(func, args.size)
+        print(f"{name:>16} {duration:>10.2f} {retained:>16.1f} {peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare the row-by-row and vectorized tag transition planning.
+
+Run with:
+
+    python benchmarks/benchmark_tag_transitions.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+from mailchimp_api.processing.tag_rules import DEFAULT_TAG_RULES
+from mailchimp_api.processing.update_tags import _create_add_and_remove_tags_dicts
+
+TAGS = ["M1", "M2", "M3", "Test API Tag", "newsletter", "customer"]
+
+
+def _iterrows_add_and_remove_tags_dicts(
+    members_with_tags_df: pd.DataFrame,
+) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    # the row-by-row version of the vectorized rules
+    rules = DEFAULT_TAG_RULES.rules
+    add_tag_members = defaultdict(list)
+    remove_tag_members = defaultdict(list)
+
+    for _, row in members_with_tags_df.iterrows():
+        member_id = row["id"]
+        matching_rules = [
+            rules[tag["name"]] for tag in row["tags"] if tag["name"] in rules
+        ]
+        if not matching_rules:
+            continue
+
+        # the first rule with the highest priority
+        rule = max(matching_rules, key=lambda rule: rule.priority)
+        if rule.next_tag is None:
+            continue
+
+        add_tag_members[rule.next_tag].append(member_id)
+        remove_tag_members[rule.tag].append(member_id)
+
+    return add_tag_members, remove_tag_members
+
+
+def _create_members_df(size: int, seed: int = 42) -> pd.DataFrame:
+    rng = random.Random(seed)
+    return pd.DataFrame(
+        {
+            "id": [f"member-{i}" for i in range(size)],
+            "email": [f"member-{i}@example.com" for i in range(size)],
+            "tags": [
+                [
+                    {"id": TAGS.index(name), "name": name}
+                    for name in rng.sample(TAGS, rng.randint(0, 3))
+                ]
+                for _ in range(size)
+            ],
+        }
+    )
+
+
+def _timeit(func, *args):  # type: ignore[no-untyped-def]
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    print(f"{'members':>10} {'iterrows [s]':>14} {'vectorized [s]':>16} {'speedup':>9}")
+    for size in args.sizes:
+        members_df = _create_members_df(size)
+        old_time, old_result = _timeit(_iterrows_add_and_remove_tags_dicts, members_df)
+        new_time, new_result = _timeit(_create_add_and_remove_tags_dicts, members_df)
+        assert tuple(map(dict, old_result)) == new_result
+
+        print(
+            f"{size:>10} {old_time:>14.3f} {new_time:>16.3f} {old_time / new_time:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
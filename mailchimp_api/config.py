@@ -1,12 +1,124 @@
+from pathlib import Path
+from typing import Optional
+
+from .processing.tag_rules import DEFAULT_TAG_RULES, TagTransitionRules
+from .services.json_decoding import JsonDecoder, get_json_loads
+
+MAX_MEMBERS_PAGE_SIZE = 1000
+MAX_LISTS_PAGE_SIZE = 1000
+# Mailchimp allows at most 10 simultaneous connections per API key
+MAX_CONCURRENT_REQUESTS = 10
+BATCH_MAX_OPERATIONS = 1000
+# stay well below the size of a request body accepted by the Mailchimp API
+BATCH_MAX_PAYLOAD_BYTES = 4 * 1024 * 1024
+
+
 class Config:
-    def __init__(self, dc: str, api_key: str):
+    def __init__(
+        self,
+        dc: str,
+        api_key: str,
+        members_page_size: int = MAX_MEMBERS_PAGE_SIZE,
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+        requests_per_second: float = 25.0,
+        pool_connections: int = 2,
+        pool_maxsize: int = MAX_CONCURRENT_REQUESTS,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        batch_max_operations: int = BATCH_MAX_OPERATIONS,
+        batch_max_payload_bytes: int = BATCH_MAX_PAYLOAD_BYTES,
+        batch_poll_interval: float = 2.0,
+        batch_max_poll_interval: float = 30.0,
+        batch_wait_timeout: float = 300.0,
+        list_cache_ttl: float = 3600.0,
+        list_cache_path: Optional[Path] = None,
+        snapshot_dir: Optional[Path] = None,
+        member_lookup_factor: float = 1.0,
+        pipeline_queue_size: int = 4,
+        json_decoder: JsonDecoder = "json",
+        tag_rules: Optional[TagTransitionRules] = None,
+    ):
         """Initialize the Config object.
 
         Args:
             dc (str): The data center identifier for the Mailchimp API.
             api_key (str): The API key for accessing Mailchimp.
+            members_page_size (int): The number of list members requested per page,
+                at most 1000.
+            max_concurrent_requests (int): The number of requests that may be sent
+                to Mailchimp at the same time, at most 10. Use 1 to send requests
+                sequentially.
+            requests_per_second (float): The sustained rate of requests sent with
+                the API key.
+            pool_connections (int): The number of hosts for which a connection pool
+                is kept.
+            pool_maxsize (int): The maximum number of keep-alive connections kept
+                open to a single host.
+            connect_timeout (float): Seconds to wait for a connection to be
+                established.
+            read_timeout (float): Seconds to wait for the server to send a response.
+            batch_max_operations (int): The maximum number of operations sent in a
+                single `/batches` request.
+            batch_max_payload_bytes (int): The maximum size of a serialized
+                `/batches` request body.
+            batch_poll_interval (float): Seconds to wait before the status of a
+                submitted batch is checked again, doubled after every check.
+            batch_max_poll_interval (float): The upper bound for the interval
+                between two checks of the same batch.
+            batch_wait_timeout (float): Seconds to wait for submitted batches to
+                finish before reporting them as unfinished.
+            list_cache_ttl (float): Seconds for which the IDs of the account's lists
+                are cached.
+            list_cache_path (Optional[Path]): A JSON file in which the IDs of the
+                account's lists are cached across processes, not used if None.
+            snapshot_dir (Optional[Path]): A directory with local snapshots of list
+                members which are synced incrementally instead of downloading all
+                members on every run, not used if None.
+            member_lookup_factor (float): CRM members are looked up one by one
+                instead of scanning the whole list when the lookups take at most
+                this many times the requests of downloading all members pages. Use
+                0 to always scan the list.
+            pipeline_queue_size (int): The number of downloaded member pages which
+                may wait for their tag updates to be planned and submitted.
+            json_decoder (JsonDecoder): The decoder of the members pages, "orjson"
+                decodes large pages several times faster but requires the orjson
+                package.
+            tag_rules (Optional[TagTransitionRules]): The rules by which members
+                are moved between tags, the M1 -> M2 -> M3 chain if None.
         """
+        if not 1 <= members_page_size <= MAX_MEMBERS_PAGE_SIZE:
+            raise ValueError(
+                f"members_page_size must be between 1 and {MAX_MEMBERS_PAGE_SIZE}"
+            )
+        if not 1 <= max_concurrent_requests <= MAX_CONCURRENT_REQUESTS:
+            raise ValueError(
+                f"max_concurrent_requests must be between 1 and {MAX_CONCURRENT_REQUESTS}"
+            )
+        # fail early instead of on the first request
+        get_json_loads(json_decoder)
+        if member_lookup_factor < 0:
+            raise ValueError("member_lookup_factor must not be negative")
+
+        self.api_key = api_key
         self.base_url = f"https://{dc}.api.mailchimp.com/3.0"
         self.headers = {
             "Authorization": f"Bearer {api_key}",
         }
+        self.members_page_size = members_page_size
+        self.max_concurrent_requests = max_concurrent_requests
+        self.requests_per_second = requests_per_second
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.batch_max_operations = batch_max_operations
+        self.batch_max_payload_bytes = batch_max_payload_bytes
+        self.batch_poll_interval = batch_poll_interval
+        self.batch_max_poll_interval = batch_max_poll_interval
+        self.batch_wait_timeout = batch_wait_timeout
+        self.list_cache_ttl = list_cache_ttl
+        self.list_cache_path = list_cache_path
+        self.snapshot_dir = snapshot_dir
+        self.member_lookup_factor = member_lookup_factor
+        self.pipeline_queue_size = pipeline_queue_size
+        self.json_decoder = json_decoder
+        self.tag_rules = tag_rules if tag_rules is not None else DEFAULT_TAG_RULES
@@ -1,3 +1,8 @@
+import os
 from pathlib import Path
 
 UPLOADED_FILES_DIR = Path(__file__).parent / "uploaded_files"
+# seconds after which an upload nobody waits for anymore is abandoned
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "1800"))
+# uploads up to this many bytes are handed over in memory
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", str(16 * 1024 * 1024)))
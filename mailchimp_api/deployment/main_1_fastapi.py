@@ -1,14 +1,35 @@
+import html
+import os
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO, Optional
 
-import pandas as pd
 from fastagency.adapters.fastapi import FastAPIAdapter
-from fastapi import FastAPI, Form, HTTPException, Query, UploadFile, status
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
-from ..constants import UPLOADED_FILES_DIR
+from ..constants import UPLOADED_FILES_DIR, UPLOAD_MEMORY_LIMIT, UPLOAD_TIMEOUT
+from ..processing.crm_file import (
+    HEADER_SAMPLE_BYTES,
+    CrmFileFormat,
+    CsvSource,
+    get_crm_file_format,
+    get_crm_file_suffixes,
+    parse_csv_header,
+    validate_crm_header,
+    validate_csv_header,
+)
+from ..upload_sessions import upload_sessions
 from ..workflow import wf
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(1024 * 1024 * 1024)))
+# the multipart boundaries and the other form fields of an upload
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
 adapter = FastAPIAdapter(provider=wf)
 
 app = FastAPI()
@@ -21,48 +42,200 @@ def list_workflows() -> dict[str, Any]:
     return {"Workflows": {name: wf.get_description(name) for name in wf.names}}
 
 
-def _save_file(file: UploadFile, timestamp: str) -> Path:
-    UPLOADED_FILES_DIR.mkdir(exist_ok=True)
+@app.middleware("http")
+async def reject_too_large_uploads(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    # the form is parsed before the endpoint runs, so its size is checked first
+    content_length = request.headers.get("content-length", "")
+    if (
+        request.url.path == "/upload"
+        and content_length.isdigit()
+        and int(content_length) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD_BYTES
+    ):
+        return JSONResponse(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            content={"detail": f"The file is larger than {MAX_UPLOAD_SIZE} bytes"},
+        )
+
+    return await call_next(request)
+
+
+def _file_too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"The file is larger than {max_size} bytes",
+    )
+
+
+async def _write_chunks(
+    file: UploadFile, f: BinaryIO, max_size: int, validate_header: bool
+) -> None:
+    # None once the header has been validated or if it isn't validated at all
+    header: Optional[bytes] = b"" if validate_header else None
+    size = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise _file_too_large(max_size)
+
+        # the header is validated as soon as its first line has been received
+        if header is not None:
+            header += chunk
+            if b"\n" in header or len(header) >= HEADER_SAMPLE_BYTES:
+                _validate_header(header)
+                header = None
+
+        await run_in_threadpool(f.write, chunk)
+
+    if header:
+        _validate_header(header)
+
+
+def _validate_header(sample: bytes) -> None:
+    try:
+        validate_csv_header(parse_csv_header(sample))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        ) from e
+
+
+def _remove_abandoned_upload(path: Path, expired_before: float) -> None:
+    # the file may be removed concurrently by its workflow or another upload
+    try:
+        modified_at = path.stat().st_mtime
+    except FileNotFoundError:
+        return
+    if modified_at < expired_before:
+        path.unlink(missing_ok=True)
+
+
+def _remove_abandoned_uploads() -> None:
+    # files uploaded after their workflow stopped waiting are never read
+    expired_before = time.time() - UPLOAD_TIMEOUT
+    for path in UPLOADED_FILES_DIR.glob("uploaded-file-*"):
+        _remove_abandoned_upload(path, expired_before)
+
+
+async def _validate_crm_header(source: CsvSource) -> None:
+    # compressed and Parquet files are validated once they have been received
     try:
-        contents = file.file.read()
-        file_name = f"uploaded-file-{timestamp}.csv"
-        path = UPLOADED_FILES_DIR / file_name
-        with path.open("wb") as f:
-            f.write(contents)
+        await run_in_threadpool(validate_crm_header, source)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e) if isinstance(e, ValueError) else "Invalid file",
+        ) from e
+
+
+async def _copy_file(
+    file: UploadFile, f: BinaryIO, max_size: Optional[int], file_format: CrmFileFormat
+) -> None:
+    if max_size is None:
+        max_size = MAX_UPLOAD_SIZE
+
+    try:
+        # the upload is copied in chunks, the blocking writes run in a thread
+        # the header of a plain CSV file is validated while it is received
+        await _write_chunks(file, f, max_size, file_format == "csv")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error uploading the file",
         ) from e
     finally:
-        file.file.close()
+        await file.close()
+
+
+async def _save_file(
+    file: UploadFile,
+    session_id: str,
+    max_size: Optional[int] = None,
+    file_format: CrmFileFormat = "csv",
+) -> Path:
+    UPLOADED_FILES_DIR.mkdir(exist_ok=True)
+    await run_in_threadpool(_remove_abandoned_uploads)
+    # the format is detected from the content when the file is read
+    file_name = f"uploaded-file-{session_id}"
+    path = UPLOADED_FILES_DIR / file_name
+    # the workflow only sees the file once it has been completely written
+    part_path = path.with_name(f"{file_name}.part")
+    try:
+        with part_path.open("wb") as f:
+            await _copy_file(file, f, max_size, file_format)
+        if file_format != "csv":
+            await _validate_crm_header(part_path)
+        part_path.replace(path)
+    finally:
+        part_path.unlink(missing_ok=True)
 
     return path
 
 
+async def _spool_file(
+    file: UploadFile,
+    max_size: Optional[int] = None,
+    file_format: CrmFileFormat = "csv",
+) -> BinaryIO:
+    # small files stay in memory, larger ones are moved to a temporary file
+    UPLOADED_FILES_DIR.mkdir(exist_ok=True)
+    spooled_file: BinaryIO = tempfile.SpooledTemporaryFile(  # type: ignore[assignment] # noqa: SIM115
+        max_size=UPLOAD_MEMORY_LIMIT, dir=str(UPLOADED_FILES_DIR)
+    )
+    try:
+        await _copy_file(file, spooled_file, max_size, file_format)
+        spooled_file.seek(0)
+        if file_format != "csv":
+            await _validate_crm_header(spooled_file)
+    except BaseException:
+        spooled_file.close()
+        raise
+
+    return spooled_file
+
+
 @app.post("/upload")
-def upload(
+async def upload(
     file: UploadFile = UploadFile(...),  # type: ignore[arg-type] # noqa: B008
-    timestamp: str = Form(...),
+    session_id: str = Form(...),
 ) -> dict[str, str]:
     if not file.size:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Please provide .csv file",
+            detail="Please provide a CRM file",
         )
-    if file.content_type != "text/csv":
+    # the whole form has already been received, but isn't copied again
+    if file.size > MAX_UPLOAD_SIZE:
+        raise _file_too_large(MAX_UPLOAD_SIZE)
+    try:
+        file_format = get_crm_file_format(file.filename or "")
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only CSV files are supported",
-        )
+            detail=str(e),
+        ) from e
 
-    path = _save_file(file, timestamp)
-    df = pd.read_csv(path)
-    if "email" not in df.columns:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="'email' column not found in CSV file",
-        )
+    session = upload_sessions.get(session_id)
+    if session is None:
+        # the workflow runs in another process and picks the file up from disk
+        await _save_file(file, session_id, file_format=file_format)
+    else:
+        if session.state != "waiting":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A file was already uploaded",
+            )
+        spooled_file = await _spool_file(file, file_format=file_format)
+        if not upload_sessions.complete(session_id, spooled_file):
+            spooled_file.close()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A file was already uploaded",
+            )
 
     return {
         "message": f"Successfully uploaded {file.filename}. Please close the tab and go back to the chat."
@@ -70,14 +243,14 @@ def upload(
 
 
 @app.get("/upload-file")
-def upload_file(timestamp: str = Query(default="default-timestamp")) -> HTMLResponse:
+def upload_file(session_id: str = Query(...)) -> HTMLResponse:
     content = f"""<body>
     <form action='/upload' enctype='multipart/form-data' method='post'>
         <div style="margin-top: 15px;">
-            <input name='file' type='file'>
+            <input name='file' type='file' accept='{",".join(get_crm_file_suffixes())}'>
         </div>
-        <!-- Hidden field for timestamp -->
-        <input name='timestamp' type='hidden' value='{timestamp}'>
+        <!-- Hidden field for the upload session -->
+        <input name='session_id' type='hidden' value='{html.escape(session_id, quote=True)}'>
         <div style="margin-top: 15px;">
             <input type='submit'>
         </div>
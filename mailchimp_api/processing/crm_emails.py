@@ -0,0 +1,69 @@
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+
+def normalize_emails(emails: pd.Series) -> pd.Series:
+    """Strip surrounding whitespace and lowercase the emails.
+
+    Args:
+        emails (pd.Series): The emails, missing values stay missing.
+    """
+    return emails.astype("string").str.strip().str.lower()
+
+
+class CrmEmailIndex:
+    """The normalized emails of a CRM export used to find its list members.
+
+    The hash table of the index is built once and reused for every page of
+    members, and the emails which matched a member are remembered so that the
+    unmatched ones can be reported.
+    """
+
+    def __init__(self, emails: Iterable[str]) -> None:
+        """Build the index from the raw CRM emails.
+
+        Args:
+            emails (Iterable[str]): The emails, empty and missing ones are ignored.
+        """
+        normalized = normalize_emails(pd.Series(list(emails), dtype="object"))
+        normalized = normalized[normalized.notna() & (normalized != "")]
+        self.index = pd.Index(normalized.unique(), dtype="object")
+        self._matched = np.zeros(len(self.index), dtype=bool)
+
+    def copy(self) -> "CrmEmailIndex":
+        """Return an index sharing the emails and their hash table with no matches.
+
+        Used to match the same CRM emails against several lists.
+        """
+        crm_emails = object.__new__(CrmEmailIndex)
+        crm_emails.index = self.index
+        crm_emails._matched = np.zeros(len(self.index), dtype=bool)
+        return crm_emails
+
+    def __len__(self) -> int:
+        """Return the number of distinct CRM emails."""
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the distinct normalized CRM emails."""
+        emails: Iterator[str] = iter(self.index)
+        return emails
+
+    def match(self, emails: pd.Series) -> npt.NDArray[np.bool_]:
+        """Return which of the emails are in the CRM and remember them as matched.
+
+        Args:
+            emails (pd.Series): The emails of list members.
+        """
+        positions = self.index.get_indexer(normalize_emails(emails).astype("object"))
+        found: npt.NDArray[np.bool_] = positions >= 0
+        self._matched[positions[found]] = True
+        return found
+
+    @property
+    def unmatched_emails(self) -> list[str]:
+        """The CRM emails which didn't match any list member."""
+        return list(self.index[~self._matched])
@@ -0,0 +1,282 @@
+import csv
+import gzip
+import importlib
+import io
+import zipfile
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import BinaryIO, Literal, Optional, Union
+
+import pandas as pd
+
+from .crm_emails import normalize_emails
+
+EMAIL_COLUMN = "email"
+# the header is expected to fit into the first bytes of the file
+HEADER_SAMPLE_BYTES = 64 * 1024
+CSV_CHUNK_SIZE = 100_000
+
+CsvEngine = Literal["c", "pyarrow"]
+CsvSource = Union[Path, BinaryIO]
+CrmFileFormat = Literal["csv", "csv.gz", "zip", "parquet"]
+
+CRM_FILE_SUFFIXES: dict[str, CrmFileFormat] = {
+    ".csv": "csv",
+    ".csv.gz": "csv.gz",
+    ".zip": "zip",
+    ".parquet": "parquet",
+}
+
+_MAGIC_BYTES: dict[bytes, CrmFileFormat] = {
+    b"\x1f\x8b": "csv.gz",
+    b"PK\x03\x04": "zip",
+    b"PAR1": "parquet",
+}
+
+
+def is_module_available(module_name: str) -> bool:
+    """Return whether an optional module, like `pyarrow.parquet`, can be imported."""
+    try:
+        importlib.import_module(module_name)
+    except ImportError:
+        return False
+
+    return True
+
+
+def get_crm_file_suffixes() -> list[str]:
+    """Return the suffixes of the CRM files which can be read."""
+    return [
+        suffix
+        for suffix, file_format in CRM_FILE_SUFFIXES.items()
+        if file_format != "parquet" or is_module_available("pyarrow.parquet")
+    ]
+
+
+def get_crm_file_format(filename: str) -> CrmFileFormat:
+    """Return the format of a CRM file from its name.
+
+    Args:
+        filename (str): The name of the file.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    for suffix, file_format in CRM_FILE_SUFFIXES.items():
+        if filename.lower().endswith(suffix):
+            if file_format == "parquet" and not is_module_available("pyarrow.parquet"):
+                raise ValueError("Parquet files require the pyarrow package")
+            return file_format
+
+    raise ValueError("Only CSV, gzipped CSV, ZIP and Parquet files are supported")
+
+
+def _read_sample(source: CsvSource, size: int) -> bytes:
+    if isinstance(source, Path):
+        with source.open("rb") as f:
+            return f.read(size)
+
+    position = source.tell()
+    sample = source.read(size)
+    source.seek(position)
+    return sample
+
+
+def sniff_crm_file_format(source: CsvSource) -> CrmFileFormat:
+    """Return the format of a CRM file from its first bytes.
+
+    Args:
+        source (CsvSource): The path or the binary file object of the file, its
+            position is left unchanged.
+    """
+    sample = _read_sample(source, 4)
+    for magic_bytes, file_format in _MAGIC_BYTES.items():
+        if sample.startswith(magic_bytes):
+            return file_format
+
+    return "csv"
+
+
+def parse_csv_header(sample: bytes) -> list[str]:
+    """Parse the column names from the first bytes of a CSV file.
+
+    Args:
+        sample (bytes): The beginning of the file, at least its first line.
+    """
+    first_line = sample.split(b"\n", 1)[0]
+    header = first_line.decode("utf-8-sig", errors="replace").rstrip("\r")
+    return next(csv.reader(io.StringIO(header)), [])
+
+
+def read_csv_header(source: CsvSource) -> list[str]:
+    """Read the column names of a CSV file without parsing its rows.
+
+    Args:
+        source (CsvSource): The path or the binary file object of the file, its
+            position is left unchanged.
+    """
+    return parse_csv_header(_read_sample(source, HEADER_SAMPLE_BYTES))
+
+
+def validate_csv_header(columns: list[str], file_kind: str = "CSV file") -> None:
+    """Raise a ValueError if the CRM file has no email column.
+
+    Args:
+        columns (list[str]): The column names of the file.
+        file_kind (str): The kind of the file used in the error message.
+    """
+    if EMAIL_COLUMN not in (column.strip() for column in columns):
+        raise ValueError(f"'{EMAIL_COLUMN}' column not found in {file_kind}")
+
+
+def validate_crm_header(source: CsvSource) -> None:
+    """Raise a ValueError if the CRM file in any supported format has no email column.
+
+    Args:
+        source (CsvSource): The path or the binary file object of the file, its
+            position is left unchanged.
+    """
+    file_kind = (
+        "Parquet file" if sniff_crm_file_format(source) == "parquet" else "CSV file"
+    )
+    validate_csv_header(read_crm_header(source), file_kind)
+
+
+@contextmanager
+def _keep_position(source: CsvSource) -> Iterator[None]:
+    # reading a file object must not affect the next reader
+    if isinstance(source, Path):
+        yield
+        return
+
+    position = source.tell()
+    try:
+        yield
+    finally:
+        source.seek(position)
+
+
+def _open_csv(
+    stack: ExitStack, source: CsvSource, file_format: CrmFileFormat
+) -> CsvSource:
+    # compressed files are decompressed while they are read
+    if file_format == "csv.gz":
+        return stack.enter_context(gzip.open(source, "rb"))  # type: ignore[return-value]
+
+    if file_format == "zip":
+        archive = stack.enter_context(zipfile.ZipFile(source))
+        csv_names = [
+            name for name in archive.namelist() if name.lower().endswith(".csv")
+        ]
+        if len(csv_names) != 1:
+            raise ValueError("The ZIP file must contain exactly one CSV file")
+        return stack.enter_context(archive.open(csv_names[0]))  # type: ignore[return-value]
+
+    return source
+
+
+def _read_parquet_columns(source: CsvSource) -> list[str]:
+    import pyarrow.parquet as pq
+
+    return list(pq.read_schema(source).names)
+
+
+def read_crm_header(source: CsvSource) -> list[str]:
+    """Read the column names of a CRM file in any of the supported formats.
+
+    Args:
+        source (CsvSource): The path or the binary file object of the file, its
+            position is left unchanged.
+    """
+    file_format = sniff_crm_file_format(source)
+    with _keep_position(source), ExitStack() as stack:
+        if file_format == "parquet":
+            return _read_parquet_columns(source)
+
+        return read_csv_header(_open_csv(stack, source, file_format))
+
+
+def _iter_email_chunks_c(source: CsvSource, chunksize: int) -> Iterator[pd.Series]:
+    with pd.read_csv(
+        source,
+        usecols=lambda column: column.strip() == EMAIL_COLUMN,
+        dtype="string",
+        chunksize=chunksize,
+    ) as reader:
+        for chunk in reader:
+            yield chunk.iloc[:, 0]
+
+
+def _iter_email_chunks_pyarrow(
+    source: CsvSource, chunksize: int
+) -> Iterator[pd.Series]:
+    from pyarrow import csv as pa_csv
+
+    column = next(c for c in read_csv_header(source) if c.strip() == EMAIL_COLUMN)
+    reader = pa_csv.open_csv(
+        source,
+        # the block size is in bytes, assume short rows
+        read_options=pa_csv.ReadOptions(block_size=max(chunksize * 64, 1 << 20)),
+        convert_options=pa_csv.ConvertOptions(include_columns=[column]),
+    )
+    for batch in reader:
+        yield batch.column(0).to_pandas().astype("string")
+
+
+def _iter_email_chunks_parquet(
+    source: CsvSource, chunksize: int
+) -> Iterator[pd.Series]:
+    import pyarrow.parquet as pq
+
+    # only the email column is read from the columnar file
+    parquet_file = pq.ParquetFile(source)
+    column = next(
+        c for c in parquet_file.schema_arrow.names if c.strip() == EMAIL_COLUMN
+    )
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=[column]):
+        yield batch.column(0).to_pandas().astype("string")
+
+
+def read_crm_emails(
+    source: CsvSource,
+    chunksize: int = CSV_CHUNK_SIZE,
+    engine: Optional[CsvEngine] = None,
+) -> set[str]:
+    """Read the distinct normalized emails of a CRM export.
+
+    CSV files, optionally gzipped or in a ZIP archive, and Parquet files are
+    supported, the format is detected from the first bytes of the file. Only the
+    email column is parsed, chunk by chunk, so the memory used depends on the
+    number of distinct emails and not on the size of the file.
+
+    Args:
+        source (CsvSource): The path or the binary file object of the file.
+        chunksize (int): The number of rows parsed at once.
+        engine (Optional[CsvEngine]): The CSV parser, pyarrow if it is installed and
+            the pandas C parser otherwise when None.
+    """
+    emails: set[str] = set()
+    with _keep_position(source), ExitStack() as stack:
+        file_format = sniff_crm_file_format(source)
+        if file_format == "parquet":
+            validate_crm_header(source)
+            chunks = _iter_email_chunks_parquet(source, chunksize)
+        else:
+            source = _open_csv(stack, source, file_format)
+            validate_csv_header(read_csv_header(source))
+
+            if engine is None:
+                engine = "pyarrow" if is_module_available("pyarrow.csv") else "c"
+            iter_email_chunks = (
+                _iter_email_chunks_pyarrow
+                if engine == "pyarrow"
+                else _iter_email_chunks_c
+            )
+            chunks = iter_email_chunks(source, chunksize)
+
+        for chunk in chunks:
+            emails.update(normalize_emails(chunk).dropna())
+
+    emails.discard("")
+    return emails
@@ -0,0 +1,131 @@
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+NO_TAG = -1
+
+
+class TagVocabulary:
+    """Interns tag names as small integer codes."""
+
+    def __init__(self) -> None:
+        """Initialize an empty vocabulary."""
+        self.names: list[str] = []
+        self._codes: dict[str, int] = {}
+
+    def encode(self, name: str) -> int:
+        """Return the code of the tag name, adding it if it is new."""
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def code(self, name: str) -> Optional[int]:
+        """Return the code of the tag name, None if it isn't in the vocabulary."""
+        return self._codes.get(name)
+
+    def decode(self, codes: npt.NDArray[np.int32]) -> npt.NDArray[np.object_]:
+        """Return the tag names of the codes."""
+        names: npt.NDArray[np.object_] = np.array(self.names, dtype=object)[codes]
+        return names
+
+    def lookup_table(
+        self, tag_map: Mapping[str, Optional[str]]
+    ) -> npt.NDArray[np.int32]:
+        """Compile a mapping between tag names into an array indexed by tag code.
+
+        Tags which are not mapped, or mapped to None, are mapped to `NO_TAG`.
+        """
+        mapped_codes = {
+            code: self.encode(mapped_name)
+            for name, mapped_name in tag_map.items()
+            if mapped_name is not None and (code := self._codes.get(name)) is not None
+        }
+
+        table = np.full(len(self.names), NO_TAG, dtype=np.int32)
+        table[list(mapped_codes)] = list(mapped_codes.values())
+        return table
+
+
+class MemberTags:
+    """Members with their tags in a compressed sparse row layout.
+
+    The tags of the member `i` are `tag_codes[tag_offsets[i]:tag_offsets[i + 1]]`,
+    so a million members take a few arrays instead of a million lists of dicts.
+    """
+
+    __slots__ = ("member_ids", "tag_codes", "tag_offsets")
+
+    def __init__(
+        self,
+        member_ids: npt.NDArray[np.object_],
+        tag_offsets: npt.NDArray[np.int64],
+        tag_codes: npt.NDArray[np.int32],
+    ) -> None:
+        """Initialize the members from their arrays.
+
+        Args:
+            member_ids (npt.NDArray[np.object_]): The IDs of the members.
+            tag_offsets (npt.NDArray[np.int64]): The start of the tags of every
+                member in `tag_codes`, followed by the number of tags.
+            tag_codes (npt.NDArray[np.int32]): The codes of the tags of all members.
+        """
+        self.member_ids = member_ids
+        self.tag_offsets = tag_offsets
+        self.tag_codes = tag_codes
+
+    @classmethod
+    def from_tags(
+        cls,
+        member_ids: Sequence[str],
+        tags: Iterable[Any],
+        vocabulary: TagVocabulary,
+    ) -> "MemberTags":
+        """Encode the tags of members as returned by the Mailchimp API.
+
+        Args:
+            member_ids (Sequence[str]): The IDs of the members.
+            tags (Iterable[Any]): The list of tag dicts of every member, anything
+                else is treated as no tags.
+            vocabulary (TagVocabulary): Interns the tag names.
+        """
+        counts = np.zeros(len(member_ids), dtype=np.int64)
+        codes: list[int] = []
+        for i, member_tags in enumerate(tags):
+            if isinstance(member_tags, list):
+                counts[i] = len(member_tags)
+                codes.extend(vocabulary.encode(tag["name"]) for tag in member_tags)
+
+        tag_offsets = np.zeros(len(member_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=tag_offsets[1:])
+        return cls(
+            np.array(member_ids, dtype=object),
+            tag_offsets,
+            np.array(codes, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_members(
+        cls, members: Sequence[Mapping[str, Any]], vocabulary: TagVocabulary
+    ) -> "MemberTags":
+        """Encode the tags of members as returned by the Mailchimp API."""
+        return cls.from_tags(
+            [member["id"] for member in members],
+            (member.get("tags") for member in members),
+            vocabulary,
+        )
+
+    def __len__(self) -> int:
+        """Return the number of members."""
+        return len(self.member_ids)
+
+    @property
+    def tag_member_indices(self) -> npt.NDArray[np.int64]:
+        """The index of the member of every tag in `tag_codes`."""
+        indices: npt.NDArray[np.int64] = np.repeat(
+            np.arange(len(self.member_ids)), np.diff(self.tag_offsets)
+        )
+        return indices
@@ -0,0 +1,74 @@
+import queue
+import threading
+from collections.abc import Generator, Iterable
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# how often a blocked producer checks whether the consumer has stopped
+_PUT_TIMEOUT = 0.1
+
+
+class _Buffer(Generic[T]):
+    def __init__(self, maxsize: int) -> None:
+        self.entries: queue.Queue[tuple[bool, Optional[T], Optional[BaseException]]] = (
+            queue.Queue(maxsize)
+        )
+        self.stopped = threading.Event()
+
+    def put(
+        self, done: bool, item: Optional[T], error: Optional[BaseException]
+    ) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.entries.put((done, item, error), timeout=_PUT_TIMEOUT)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def produce(self, items: Iterable[T]) -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not self.put(False, item, None):
+                    return
+        except BaseException as e:
+            self.put(True, None, e)
+        else:
+            self.put(True, None, None)
+        finally:
+            # a generator stopped early releases its resources in this thread
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+
+def prefetch(items: Iterable[T], maxsize: int) -> Generator[T, None, None]:
+    """Iterate over the items while they are produced in a background thread.
+
+    The producer runs at most `maxsize` items ahead of the consumer, so producing
+    the next items overlaps with processing the current one while the memory used
+    stays bounded. An error raised by the producer is raised to the consumer, and
+    closing the returned generator stops the producer and closes `items` in the
+    background thread.
+
+    Args:
+        items (Iterable[T]): The items, iterated in the background thread.
+        maxsize (int): The maximum number of items waiting to be consumed.
+    """
+    buffer: _Buffer[T] = _Buffer(maxsize)
+    producer = threading.Thread(target=buffer.produce, args=(items,), daemon=True)
+    producer.start()
+    try:
+        while True:
+            done, item, error = buffer.entries.get()
+            if error is not None:
+                raise error
+            if done:
+                return
+            yield item  # type: ignore[misc]
+    finally:
+        # a consumer which stops early releases the blocked producer
+        buffer.stopped.set()
+        producer.join()
@@ -0,0 +1,223 @@
+import json
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .member_tags import NO_TAG, MemberTags, TagVocabulary
+
+DEFAULT_DATED_TAG_TEMPLATE = "{tag} - {date:%d.%m.%Y.}"
+# the priority of tags which don't have a rule
+NO_RULE = np.iinfo(np.int32).min
+# terminal tags outrank every chain unless their priority is given explicitly
+TERMINAL_TAG_PRIORITY = np.iinfo(np.int32).max
+
+
+@dataclass(frozen=True)
+class TagTransitionRule:
+    """Moves members with `tag` to `next_tag`, or keeps them if it is terminal.
+
+    When a member has several tags with a rule, only the rule with the highest
+    priority is applied.
+    """
+
+    tag: str
+    next_tag: Optional[str] = None
+    priority: int = 0
+
+    @property
+    def terminal(self) -> bool:
+        """Whether members with the tag are never moved to another tag."""
+        return self.next_tag is None
+
+
+class TagTransitionRules:
+    """Transition rules compiled into lookup tables indexed by tag code."""
+
+    def __init__(
+        self,
+        rules: Iterable[TagTransitionRule],
+        dated_tag_template: Optional[str] = DEFAULT_DATED_TAG_TEMPLATE,
+    ) -> None:
+        """Initialize the rules.
+
+        Args:
+            rules (Iterable[TagTransitionRule]): The rules, at most one per tag.
+            dated_tag_template (Optional[str]): The template of the tag added
+                together with the next tag, formatted with `tag` and `date`. No
+                dated tag is added if None.
+
+        Raises:
+            ValueError: If there are several rules for the same tag.
+        """
+        self.rules: dict[str, TagTransitionRule] = {}
+        for rule in rules:
+            if rule.tag in self.rules:
+                raise ValueError(f"Tag {rule.tag} has more than one transition rule")
+            self.rules[rule.tag] = rule
+        self.dated_tag_template = dated_tag_template
+
+    @classmethod
+    def from_chains(
+        cls,
+        chains: Iterable[list[str]],
+        terminal_tags: Iterable[str] = (),
+        priorities: Optional[Mapping[str, int]] = None,
+        dated_tag_template: Optional[str] = DEFAULT_DATED_TAG_TEMPLATE,
+    ) -> "TagTransitionRules":
+        """Create the rules of chains of tags like M1 -> M2 -> M3.
+
+        The last tag of a chain is terminal and later tags of a chain have a higher
+        priority, so a member with several tags of a chain advances from the
+        furthest one.
+
+        Args:
+            chains (Iterable[list[str]]): The chains of tags.
+            terminal_tags (Iterable[str]): Tags which keep members where they are,
+                with the highest priority by default.
+            priorities (Optional[Mapping[str, int]]): Priorities overriding the
+                default ones by tag.
+            dated_tag_template (Optional[str]): The template of the dated tag.
+        """
+        priorities = priorities or {}
+        rules = [
+            TagTransitionRule(
+                tag=tag,
+                next_tag=chain[i + 1] if i + 1 < len(chain) else None,
+                priority=priorities.get(tag, i),
+            )
+            for chain in chains
+            for i, tag in enumerate(chain)
+        ]
+        rules.extend(
+            TagTransitionRule(
+                tag=tag, priority=priorities.get(tag, int(TERMINAL_TAG_PRIORITY))
+            )
+            for tag in terminal_tags
+        )
+        return cls(rules, dated_tag_template)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "TagTransitionRules":
+        """Create the rules from their configuration.
+
+        The configuration may contain `chains`, `terminal_tags`, `priorities` and
+        `dated_tag_template` as accepted by `from_chains`, and explicit `rules`
+        with a `tag`, an optional `next_tag` and `priority`.
+        """
+        chain_rules = cls.from_chains(
+            chains=data.get("chains", []),
+            terminal_tags=data.get("terminal_tags", []),
+            priorities=data.get("priorities"),
+        ).rules.values()
+        rules = [
+            TagTransitionRule(
+                tag=rule["tag"],
+                next_tag=rule.get("next_tag"),
+                priority=rule.get("priority", 0),
+            )
+            for rule in data.get("rules", [])
+        ]
+        return cls(
+            [*chain_rules, *rules],
+            data.get("dated_tag_template", DEFAULT_DATED_TAG_TEMPLATE),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "TagTransitionRules":
+        """Load the rules from a JSON file in the format accepted by `from_dict`."""
+        return cls.from_dict(json.loads(path.read_text()))
+
+    @property
+    def next_tag_map(self) -> dict[str, Optional[str]]:
+        """The next tag of every tag with a rule, None for terminal tags."""
+        return {tag: rule.next_tag for tag, rule in self.rules.items()}
+
+    def dated_tag(self, tag: str, date: datetime) -> Optional[str]:
+        """Return the dated tag added together with the tag, None if there is none."""
+        if self.dated_tag_template is None:
+            return None
+        return self.dated_tag_template.format(tag=tag, date=date)
+
+    def compile(
+        self, vocabulary: TagVocabulary
+    ) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int32]]:
+        """Compile the rules into lookup tables indexed by the tag codes.
+
+        Returns:
+            The code of the next tag of every tag, `NO_TAG` if it has none, and
+            the priority of every tag, `NO_RULE` if it has no rule.
+        """
+        next_codes = vocabulary.lookup_table(self.next_tag_map)
+        priorities = np.full(len(next_codes), NO_RULE, dtype=np.int32)
+        for tag, rule in self.rules.items():
+            code = vocabulary.code(tag)
+            if code is not None:
+                priorities[code] = rule.priority
+
+        return next_codes, priorities
+
+    def plan(
+        self, member_tags: MemberTags, vocabulary: TagVocabulary
+    ) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+        """Find the tags to add and remove, applying one rule per member.
+
+        The rule of the member's tag with the highest priority is applied, the
+        first one of the member's tags on ties. Members whose rule is terminal keep
+        their tags.
+
+        Args:
+            member_tags (MemberTags): The members with their tags.
+            vocabulary (TagVocabulary): The vocabulary the tags are encoded with.
+
+        Returns:
+            The IDs of the members by the tag to add, and by the tag to remove.
+        """
+        next_codes_table, priorities_table = self.compile(vocabulary)
+        tag_codes = member_tags.tag_codes
+        priorities = priorities_table[tag_codes]
+
+        # the positions of tags with a rule, sorted by member, priority and position
+        positions = np.flatnonzero(priorities != NO_RULE)
+        members = member_tags.tag_member_indices[positions]
+        order = np.lexsort(
+            (positions, -priorities[positions].astype(np.int64), members)
+        )
+        positions, members = positions[order], members[order]
+
+        # the first position of every member has the rule which is applied
+        is_first = np.ones(len(positions), dtype=bool)
+        is_first[1:] = members[1:] != members[:-1]
+        positions, members = positions[is_first], members[is_first]
+
+        next_codes = next_codes_table[tag_codes[positions]]
+        moves = next_codes != NO_TAG
+        if not moves.any():
+            return {}, {}
+
+        member_ids = member_tags.member_ids[members[moves]]
+        add_tag_members = _group_member_ids(
+            member_ids, vocabulary.decode(next_codes[moves])
+        )
+        remove_tag_members = _group_member_ids(
+            member_ids, vocabulary.decode(tag_codes[positions[moves]])
+        )
+        return add_tag_members, remove_tag_members
+
+
+def _group_member_ids(
+    member_ids: npt.NDArray[np.object_], tag_names: npt.NDArray[np.object_]
+) -> dict[str, list[str]]:
+    # tags are in the order of their first member, members in their original order
+    grouped: dict[str, list[str]] = (
+        pd.Series(member_ids).groupby(tag_names, sort=False).agg(list).to_dict()
+    )
+    return grouped
+
+
+DEFAULT_TAG_RULES = TagTransitionRules.from_chains([["M1", "M2", "M3"]])
@@ -1,127 +1,423 @@
+import asyncio
+import logging
+import math
 from collections import defaultdict
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Literal
+from pathlib import Path
+from typing import Any, Literal, Optional, Union
 
 import pandas as pd
 
 from ..config import Config
+from ..services.async_mailchimp_service import AsyncMailchimpService
+from ..services.batch_tracker import BatchTracker
+from ..services.batches import (
+    BatchSubmission,
+    MemberTag,
+    Operation,
+    create_member_tags_operations,
+    pack_operations,
+)
 from ..services.mailchimp_service import MailchimpService
+from ..storage.member_snapshot_store import MemberSnapshotStore
+from .crm_emails import CrmEmailIndex
+from .member_tags import MemberTags, TagVocabulary
+from .pipeline import prefetch
+from .tag_rules import DEFAULT_TAG_RULES, TagTransitionRules
 
-next_tag_map = {
-    "M1": "M2",
-    "M2": "M3",
-    "M3": None,
-}
+logger = logging.getLogger(__name__)
+
+MAX_LOGGED_UNMATCHED_EMAILS = 5
 
 
 def _create_add_and_remove_tags_dicts(
     members_with_tags_df: pd.DataFrame,
+    tag_rules: TagTransitionRules = DEFAULT_TAG_RULES,
 ) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    member_tags = MemberTags.from_tags(
+        members_with_tags_df["id"].tolist(),
+        members_with_tags_df["tags"],
+        vocabulary := TagVocabulary(),
+    )
+
     # keys are tags, values are list of member ids
-    add_tag_members = defaultdict(list)
-    remove_tag_members = defaultdict(list)
-
-    for _, row in members_with_tags_df.iterrows():
-        member_id = row["id"]
-        tags = row["tags"]
-        for tag in tags:
-            tag_name = tag["name"]
-            if tag_name not in next_tag_map:
-                continue
+    return tag_rules.plan(member_tags, vocabulary)
 
-            next_tag = next_tag_map[tag_name]
-            if next_tag is None:
-                continue
 
-            add_tag_members[next_tag].append(member_id)
-            remove_tag_members[tag_name].append(member_id)
+def _plan_member_tags(
+    add_tag_members: dict[str, list[str]],
+    remove_tag_members: dict[str, list[str]],
+    tag_rules: TagTransitionRules = DEFAULT_TAG_RULES,
+    now: Optional[datetime] = None,
+) -> dict[str, list[MemberTag]]:
+    # all tag changes of a member are sent in a single operation
+    if now is None:
+        now = datetime.now()
+    member_tags: dict[str, list[MemberTag]] = defaultdict(list)
 
-    return add_tag_members, remove_tag_members
+    for tag_name, member_ids in add_tag_members.items():
+        tags: list[MemberTag] = [{"name": tag_name, "status": "active"}]
+        # Add additional tag with the current date
+        dated_tag_name = tag_rules.dated_tag(tag_name, now)
+        if dated_tag_name is not None:
+            tags.append({"name": dated_tag_name, "status": "active"})
+        for member_id in member_ids:
+            member_tags[member_id].extend(tags)
+
+    for tag_name, member_ids in remove_tag_members.items():
+        for member_id in member_ids:
+            member_tags[member_id].append({"name": tag_name, "status": "inactive"})
+
+    return member_tags
+
+
+async def _batch_update_tags_async(
+    mailchimp_service: AsyncMailchimpService,
+    list_id: str,
+    member_tags: dict[str, list[MemberTag]],
+) -> BatchSubmission:
+    operations = create_member_tags_operations(list_id, member_tags)
+    return await mailchimp_service.submit_operations(operations)
+
+
+def _filter_crm_members(
+    members: list[dict[str, Any]], crm_emails: CrmEmailIndex
+) -> pd.DataFrame:
+    page_df = pd.DataFrame(members)
+    page_df.rename(columns={"email_address": "email"}, inplace=True)
+    return page_df[crm_emails.match(page_df["email"])]
+
+
+def _select_crm_members(
+    members: list[dict[str, Any]], crm_emails: CrmEmailIndex
+) -> list[dict[str, Any]]:
+    found = crm_emails.match(pd.Series([member["email_address"] for member in members]))
+    return [member for member, is_crm_member in zip(members, found) if is_crm_member]
+
+
+def _concat_members_pages(pages: list[pd.DataFrame]) -> pd.DataFrame:
+    if not pages:
+        return pd.DataFrame(columns=["id", "email", "tags"])
+
+    return pd.concat(pages, ignore_index=True)
+
+
+def _iter_members_pages(
+    mailchimp_service: MailchimpService, list_id: str
+) -> Iterator[list[dict[str, Any]]]:
+    snapshot_dir = mailchimp_service.config.snapshot_dir
+    if snapshot_dir is None:
+        yield from mailchimp_service.iter_members_with_tags(list_id)
+        return
+
+    # only the members changed since the last run are downloaded
+    with MemberSnapshotStore.for_list(snapshot_dir, list_id) as snapshot_store:
+        snapshot_store.sync(mailchimp_service, list_id)
+        yield from snapshot_store.iter_members(
+            mailchimp_service.config.members_page_size
+        )
+
+
+def _should_look_up_members(
+    mailchimp_service: MailchimpService, list_id: str, crm_emails: CrmEmailIndex
+) -> bool:
+    config = mailchimp_service.config
+    # the snapshot is synced incrementally, which is cheaper than any lookup
+    if config.snapshot_dir is not None or config.member_lookup_factor == 0:
+        return False
 
+    # a lookup is a request per CRM email, a scan is a request per members page
+    member_count = mailchimp_service.get_member_count(list_id)
+    page_requests = math.ceil(member_count / config.members_page_size)
+    return len(crm_emails) <= config.member_lookup_factor * page_requests
 
-def _batch_update_tags(
+
+def _iter_crm_members_pages(
     mailchimp_service: MailchimpService,
     list_id: str,
-    tag_members: dict[str, list[str]],
-    status: Literal["active", "inactive"],
+    crm_emails: CrmEmailIndex,
+) -> Iterator[list[dict[str, Any]]]:
+    # few CRM emails are looked up directly instead of scanning a large list
+    if _should_look_up_members(mailchimp_service, list_id, crm_emails):
+        return mailchimp_service.iter_members_with_tags_by_email(list_id, crm_emails)
+
+    return _iter_members_pages(mailchimp_service, list_id)
+
+
+def _log_unmatched_emails(crm_emails: CrmEmailIndex, list_name: str) -> None:
+    unmatched_emails = crm_emails.unmatched_emails
+    if unmatched_emails:
+        logger.warning(
+            "%d of %d CRM emails are not members of list %s, for example: %s",
+            len(unmatched_emails),
+            len(crm_emails),
+            list_name,
+            ", ".join(unmatched_emails[:MAX_LOGGED_UNMATCHED_EMAILS]),
+        )
+
+
+def _extend_tag_members(
+    tag_members: dict[str, list[str]], page_tag_members: dict[str, list[str]]
 ) -> None:
-    for tag_name, member_ids in tag_members.items():
-        mailchimp_service.post_batch_update_members_tag(
-            list_id=list_id,
-            member_ids=member_ids,
-            tag_name=tag_name,
-            status=status,
+    for tag_name, member_ids in page_tag_members.items():
+        tag_members.setdefault(tag_name, []).extend(member_ids)
+
+
+def _apply_submitted_tags_to_snapshot(
+    snapshot_dir: Path,
+    list_id: str,
+    member_tags: dict[str, list[MemberTag]],
+    submission: BatchSubmission,
+) -> None:
+    # members whose request failed keep their tags, the path ends with their ID
+    failed_member_ids = {
+        operation["path"].split("/")[-2]
+        for failure in submission.failures
+        for operation in failure.operations
+    }
+    with MemberSnapshotStore.for_list(snapshot_dir, list_id) as snapshot_store:
+        snapshot_store.apply_tag_changes(
+            {
+                member_id: tags
+                for member_id, tags in member_tags.items()
+                if member_id not in failed_member_ids
+            }
         )
-        if status == "active":
-            # Add additional tag with the current date
-            tag_name_with_date = f"{tag_name} - {datetime.now().strftime('%d.%m.%Y.')}"
-            mailchimp_service.post_batch_update_members_tag(
-                list_id=list_id,
-                member_ids=member_ids,
-                tag_name=tag_name_with_date,
-                status=status,
-            )
 
 
-def _add_and_remove_tags(
+@dataclass
+class ListUpdateSummary:
+    """The tags updated in a single list by `update_tags_for_lists`.
+
+    In a dry run nothing is submitted and `batch_requests` is the number of
+    `/batches` requests the operations would be packed into.
+    """
+
+    list_name: str
+    add_tag_members: dict[str, list[str]] = field(default_factory=dict)
+    remove_tag_members: dict[str, list[str]] = field(default_factory=dict)
+    error: Optional[str] = None
+    operations: int = 0
+    batch_requests: int = 0
+
+
+def _update_list_tags(
     mailchimp_service: MailchimpService,
     list_id: str,
-    members_with_tags_df: pd.DataFrame,
-) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
-    add_tag_members, remove_tag_members = _create_add_and_remove_tags_dicts(
-        members_with_tags_df=members_with_tags_df,
-    )
+    list_name: str,
+    crm_emails: CrmEmailIndex,
+    batch_tracker: Optional[BatchTracker],
+    dry_run: bool = False,
+) -> ListUpdateSummary:
+    summary = ListUpdateSummary(list_name=list_name)
+    config = mailchimp_service.config
+    tag_rules = config.tag_rules
+    # all members of the run get the same dated tag
+    now = datetime.now()
+    # tag names are interned once for all pages of the list
+    vocabulary = TagVocabulary()
 
-    _batch_update_tags(
-        mailchimp_service=mailchimp_service,
-        list_id=list_id,
-        tag_members=add_tag_members,
-        status="active",
-    )
+    def iter_operations() -> Iterator[Operation]:
+        # the next pages are downloaded while a page is planned and submitted
+        members_pages = prefetch(
+            _iter_crm_members_pages(mailchimp_service, list_id, crm_emails),
+            maxsize=config.pipeline_queue_size,
+        )
+        for members in members_pages:
+            # keep only the members that are in the CRM, with their tags encoded
+            crm_members = _select_crm_members(members, crm_emails)
+            if not crm_members:
+                continue
+            member_tags = MemberTags.from_members(crm_members, vocabulary)
 
-    _batch_update_tags(
-        mailchimp_service=mailchimp_service,
-        list_id=list_id,
-        tag_members=remove_tag_members,
-        status="inactive",
-    )
+            page_add_tag_members, page_remove_tag_members = tag_rules.plan(
+                member_tags, vocabulary
+            )
+            _extend_tag_members(summary.add_tag_members, page_add_tag_members)
+            _extend_tag_members(summary.remove_tag_members, page_remove_tag_members)
 
-    return add_tag_members, remove_tag_members
+            planned_member_tags = _plan_member_tags(
+                page_add_tag_members, page_remove_tag_members, tag_rules, now
+            )
+            # a single operation per member
+            summary.operations += len(planned_member_tags)
+            yield from create_member_tags_operations(list_id, planned_member_tags)
+
+    if dry_run:
+        # the operations are packed exactly as they would be submitted
+        summary.batch_requests = sum(
+            1
+            for _ in pack_operations(
+                iter_operations(),
+                max_operations=config.batch_max_operations,
+                max_payload_bytes=config.batch_max_payload_bytes,
+            )
+        )
+        _log_unmatched_emails(crm_emails, list_name)
+        return summary
+
+    # operations are packed and posted while the next ones are planned
+    submission = mailchimp_service.submit_operations(iter_operations())
+    summary.batch_requests = len(submission.batch_ids) + len(submission.failures)
+    if config.snapshot_dir is not None:
+        _apply_submitted_tags_to_snapshot(
+            config.snapshot_dir,
+            list_id,
+            _plan_member_tags(
+                summary.add_tag_members, summary.remove_tag_members, tag_rules, now
+            ),
+            submission,
+        )
+    _log_unmatched_emails(crm_emails, list_name)
+    if batch_tracker is not None:
+        batch_tracker.track(submission.batch_ids)
+    submission.raise_for_failures()
+
+    return summary
 
 
 def update_tags(
-    crm_df: pd.DataFrame, config: Config, list_name: str
+    crm_emails: Iterable[str],
+    config: Config,
+    list_name: str,
+    batch_tracker: Optional[BatchTracker] = None,
 ) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
-    """Update tags for members in the CRM."""
-    # Create a Mailchimp service
-    mailchimp_service = MailchimpService(config)
-
-    # Get the list ID for the list name
-    account_lists = mailchimp_service.get_account_lists()
-    list_id = None
-    for account_list in account_lists["lists"]:
-        if account_list["name"] == list_name:
-            list_id = account_list["id"]
-
-    if list_id is None:
-        raise ValueError(f"List {list_name} not found in account lists.")
-
-    # Get the members with tags
-    members_with_tags = mailchimp_service.get_members_with_tags(list_id)
-
-    members_with_tags_df = pd.DataFrame(members_with_tags["members"])
-    members_with_tags_df.rename(columns={"email_address": "email"}, inplace=True)
-
-    # filter only emails that are in the CRM
-    crm_emails = crm_df["email"].unique()
-    members_with_tags_df = members_with_tags_df[
-        members_with_tags_df["email"].isin(crm_emails)
-    ]
-
-    add_tag_members, remove_tag_members = _add_and_remove_tags(
-        mailchimp_service=mailchimp_service,
-        list_id=list_id,
-        members_with_tags_df=members_with_tags_df,
-    )
+    """Update tags for members in the CRM.
+
+    The CRM emails are matched with the list members regardless of case and
+    surrounding whitespace. The submitted batches are recorded in `batch_tracker`,
+    if given, so that their results can be waited for. Use `update_tags_for_lists`
+    with `dry_run` to plan the updates without submitting them.
+    """
+    crm_email_index = CrmEmailIndex(crm_emails)
+
+    # Create a Mailchimp service, all requests share its connection pool
+    with MailchimpService(config) as mailchimp_service:
+        # Get the list ID for the list name
+        list_id = mailchimp_service.get_list_id(list_name)
+
+        summary = _update_list_tags(
+            mailchimp_service=mailchimp_service,
+            list_id=list_id,
+            list_name=list_name,
+            crm_emails=crm_email_index,
+            batch_tracker=batch_tracker,
+        )
+
+    return summary.add_tag_members, summary.remove_tag_members
+
+
+def update_tags_for_lists(
+    crm_emails: Iterable[str],
+    config: Config,
+    list_names: Union[Sequence[str], Literal["all"]],
+    batch_tracker: Optional[BatchTracker] = None,
+    dry_run: bool = False,
+) -> list[ListUpdateSummary]:
+    """Update tags for members in the CRM in several lists at the same time.
+
+    The CRM emails are indexed once for all lists. The lists are processed
+    concurrently, their requests are still rate limited together because they
+    share the API key. A list which fails doesn't stop the others, its error is
+    reported in its summary instead.
+
+    Args:
+        crm_emails (Iterable[str]): The emails of the CRM members.
+        config (Config): The configuration object containing API details.
+        list_names (Union[Sequence[str], Literal["all"]]): The names of the lists,
+            or "all" for every list in the account.
+        batch_tracker (Optional[BatchTracker]): Records the submitted batches so
+            that their results can be waited for.
+        dry_run (bool): Plan the updates and estimate the `/batches` requests
+            without submitting anything.
+
+    Returns:
+        The summaries of the lists, in the order of `list_names`.
+    """
+    crm_email_index = CrmEmailIndex(crm_emails)
+
+    with MailchimpService(config) as mailchimp_service:
+        list_ids = mailchimp_service.get_list_ids()
+        if list_names == "all":
+            list_names = list(list_ids)
+        elif any(list_name not in list_ids for list_name in list_names):
+            list_ids = mailchimp_service.get_list_ids(refresh=True)
+
+        def update_list(list_name: str) -> ListUpdateSummary:
+            if list_name not in list_ids:
+                return ListUpdateSummary(
+                    list_name=list_name,
+                    error=f"List {list_name} not found in account lists.",
+                )
+
+            try:
+                return _update_list_tags(
+                    mailchimp_service=mailchimp_service,
+                    list_id=list_ids[list_name],
+                    list_name=list_name,
+                    crm_emails=crm_email_index.copy(),
+                    batch_tracker=batch_tracker,
+                    dry_run=dry_run,
+                )
+            except Exception as e:
+                logger.exception("Updating tags in list %s failed", list_name)
+                return ListUpdateSummary(list_name=list_name, error=str(e))
+
+        if not list_names:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(len(list_names), config.max_concurrent_requests)
+        ) as executor:
+            return list(executor.map(update_list, list_names))
+
+
+async def update_tags_async(
+    crm_emails: Iterable[str],
+    config: Config,
+    list_name: str,
+    batch_tracker: Optional[BatchTracker] = None,
+) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    """Update tags for members in the CRM without blocking the event loop.
+
+    All members are downloaded even if `config.snapshot_dir` is set, the submitted
+    tag changes are still written to the snapshot to keep it up to date.
+    """
+    async with AsyncMailchimpService(config) as mailchimp_service:
+        list_id = await mailchimp_service.get_list_id(list_name)
+
+        crm_email_index = CrmEmailIndex(crm_emails)
+        pages = [
+            _filter_crm_members(members, crm_email_index)
+            async for members in mailchimp_service.iter_members_with_tags(list_id)
+        ]
+        members_with_tags_df = _concat_members_pages(pages)
+        _log_unmatched_emails(crm_email_index, list_name)
+
+        add_tag_members, remove_tag_members = _create_add_and_remove_tags_dicts(
+            members_with_tags_df=members_with_tags_df,
+            tag_rules=config.tag_rules,
+        )
+        member_tags = _plan_member_tags(
+            add_tag_members, remove_tag_members, config.tag_rules
+        )
+        submission = await _batch_update_tags_async(
+            mailchimp_service=mailchimp_service,
+            list_id=list_id,
+            member_tags=member_tags,
+        )
+        if config.snapshot_dir is not None:
+            await asyncio.to_thread(
+                _apply_submitted_tags_to_snapshot,
+                config.snapshot_dir,
+                list_id,
+                member_tags,
+                submission,
+            )
+        if batch_tracker is not None:
+            batch_tracker.track(submission.batch_ids)
+        submission.raise_for_failures()
 
     return add_tag_members, remove_tag_members
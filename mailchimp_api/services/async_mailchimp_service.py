@@ -0,0 +1,246 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from itertools import islice
+from types import TracebackType
+from typing import Any, Literal, Optional
+
+import httpx
+
+from ..config import MAX_LISTS_PAGE_SIZE, Config
+from .batches import (
+    BatchChunkFailure,
+    BatchSubmission,
+    Operation,
+    create_tag_operations,
+    pack_operations,
+)
+from .json_decoding import get_json_loads
+from .list_cache import create_list_index, list_index_cache
+from .request_scheduler import RequestScheduler, get_retry_after, scheduled_retry
+
+
+class AsyncMailchimpService:
+    def __init__(self, config: Config) -> None:
+        """Initialize the AsyncMailchimpService with a configuration.
+
+        Args:
+            config (Config): The configuration object containing API details.
+        """
+        self.config = config
+        self.client = self._create_client()
+        self._json_loads = get_json_loads(config.json_decoder)
+        self.scheduler = RequestScheduler.for_api_key(
+            config.api_key,
+            requests_per_second=config.requests_per_second,
+            max_in_flight=config.max_concurrent_requests,
+        )
+
+    def _create_client(self) -> httpx.AsyncClient:
+        connect_timeout, read_timeout = self.config.timeout
+        return httpx.AsyncClient(
+            headers=self.config.headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.config.pool_maxsize,
+                max_keepalive_connections=self.config.pool_maxsize,
+            ),
+        )
+
+    async def aclose(self) -> None:
+        """Close the HTTP client and its pooled connections."""
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "AsyncMailchimpService":
+        """Enter the context, the client is closed on exit."""
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        """Close the client when leaving the context."""
+        await self.aclose()
+
+    def _decode(self, response: httpx.Response) -> Any:
+        # most of the decoding time is spent on the large pages of members
+        if self.config.json_decoder == "json":
+            return response.json()
+        return self._json_loads(response.content)
+
+    def _raise_for_status(self, response: httpx.Response) -> None:
+        if response.status_code == 429:
+            self.scheduler.record_throttled(get_retry_after(response))
+
+        if response.status_code < 200 or response.status_code >= 300:
+            # This automatically raises an HTTPStatusError with details
+            response.raise_for_status()
+
+    @scheduled_retry
+    async def _mailchimp_request_get(self, url: str) -> dict[str, Any]:
+        async with self.scheduler.async_slot():
+            response = await self.client.get(url)
+
+        self._raise_for_status(response)
+
+        return self._decode(response)  # type: ignore[no-any-return]
+
+    async def _mailchimp_request_post(
+        self, url: str, body: dict[str, Any]
+    ) -> dict[str, Any]:
+        async with self.scheduler.async_slot():
+            response = await self.client.post(url, json=body)
+
+        self._raise_for_status(response)
+
+        return response.json()  # type: ignore[no-any-return]
+
+    async def get_account_lists(self) -> dict[str, Any]:
+        """Get information about all lists in the account.
+
+        Behaves like `MailchimpService.get_account_lists`.
+        """
+        lists: list[dict[str, str]] = []
+        while True:
+            url = f"{self.config.base_url}/lists?fields=lists.id,lists.name,total_items&count={MAX_LISTS_PAGE_SIZE}&offset={len(lists)}"
+            page = await self._mailchimp_request_get(url)
+            page_lists = page.get("lists", [])
+            lists.extend(page_lists)
+            if not page_lists or len(lists) >= page.get("total_items", 0):
+                return {"lists": lists}
+
+    async def get_list_id(self, list_name: str) -> str:
+        """Get the ID of the list with the given name.
+
+        The index of the account's lists is cached and fetched again when the name
+        is not found in the cached index.
+
+        Args:
+            list_name (str): The name of the list.
+        """
+        index = list_index_cache.get(self.config)
+        if index is None or list_name not in index:
+            index = create_list_index(await self.get_account_lists())
+            list_index_cache.set(self.config, index)
+
+        if list_name not in index:
+            raise ValueError(f"List {list_name} not found in account lists.")
+
+        return index[list_name]
+
+    async def get_members_with_tags(
+        self, list_id: str, count: int, offset: int = 0
+    ) -> dict[str, Any]:
+        url = f"{self.config.base_url}/lists/{list_id}/members?fields=members.id,members.email_address,members.tags.name,total_items&count={count}&offset={offset}"
+
+        return await self._mailchimp_request_get(url)
+
+    async def iter_members_with_tags(
+        self, list_id: str
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Yield pages of list members together with their tags.
+
+        Behaves like `MailchimpService.iter_members_with_tags`, with up to
+        `config.max_concurrent_requests` pages requested at the same time.
+
+        Args:
+            list_id (str): The ID of the list.
+        """
+        page_size = self.config.members_page_size
+
+        first_page = await self.get_members_with_tags(list_id, count=page_size)
+        members = first_page.get("members", [])
+        if not members:
+            return
+        yield members
+
+        offsets = iter(range(page_size, first_page.get("total_items", 0), page_size))
+        pending = deque(
+            asyncio.ensure_future(
+                self.get_members_with_tags(list_id, page_size, offset)
+            )
+            for offset in islice(offsets, self.config.max_concurrent_requests)
+        )
+        try:
+            while pending:
+                page = await pending.popleft()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append(
+                        asyncio.ensure_future(
+                            self.get_members_with_tags(list_id, page_size, next_offset)
+                        )
+                    )
+
+                members = page.get("members", [])
+                if members:
+                    yield members
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @scheduled_retry
+    async def _post_batch(self, operations: list[Operation]) -> dict[str, Any]:
+        url = f"{self.config.base_url}/batches"
+        body = {"operations": operations}
+        return await self._mailchimp_request_post(url, body)
+
+    async def submit_batches(
+        self, chunks: Iterable[list[Operation]]
+    ) -> BatchSubmission:
+        """Post each chunk of operations as a separate `/batches` request.
+
+        Behaves like `MailchimpService.submit_batches`.
+
+        Args:
+            chunks (Iterable[list[Operation]]): The chunks of batch operations.
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+
+        async def post_chunk(chunk: list[Operation]) -> dict[str, Any]:
+            async with semaphore:
+                return await self._post_batch(chunk)
+
+        chunks = list(chunks)
+        responses = await asyncio.gather(
+            *(post_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )
+
+        submission = BatchSubmission()
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, BaseException):
+                submission.failures.append(BatchChunkFailure(chunk, response))
+            elif "id" in response:
+                submission.batch_ids.append(response["id"])
+
+        return submission
+
+    async def submit_operations(
+        self, operations: Iterable[Operation]
+    ) -> BatchSubmission:
+        """Pack operations into as few `/batches` requests as possible and post them.
+
+        Args:
+            operations (Iterable[Operation]): The batch operations.
+        """
+        chunks = pack_operations(
+            operations,
+            max_operations=self.config.batch_max_operations,
+            max_payload_bytes=self.config.batch_max_payload_bytes,
+        )
+        return await self.submit_batches(chunks)
+
+    async def post_batch_update_members_tag(
+        self,
+        list_id: str,
+        member_ids: list[str],
+        tag_name: str,
+        status: Literal["active", "inactive"] = "active",
+    ) -> dict[str, str]:
+        operations = create_tag_operations(list_id, member_ids, tag_name, status)
+        submission = await self.submit_operations(operations)
+        submission.raise_for_failures()
+
+        return {"status": "success"}
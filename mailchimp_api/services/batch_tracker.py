@@ -0,0 +1,186 @@
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+
+from tenacity import (
+    RetryCallState,
+    Retrying,
+    retry_if_result,
+    stop_after_delay,
+    wait_exponential,
+)
+
+from ..config import Config
+from .mailchimp_service import MailchimpService
+
+# number of failed operation responses kept per batch for reporting
+MAX_REPORTED_ERRORS = 10
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+@dataclass
+class BatchResult:
+    id: str
+    status: str
+    total_operations: int = 0
+    finished_operations: int = 0
+    errored_operations: int = 0
+    submitted_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def from_response(cls, batch: dict[str, Any]) -> "BatchResult":
+        """Create the result from a `/batches/{batch_id}` response."""
+        return cls(
+            id=batch["id"],
+            status=batch["status"],
+            total_operations=batch.get("total_operations", 0),
+            finished_operations=batch.get("finished_operations", 0),
+            errored_operations=batch.get("errored_operations", 0),
+            submitted_at=_parse_datetime(batch.get("submitted_at")),
+            completed_at=_parse_datetime(batch.get("completed_at")),
+        )
+
+    @property
+    def finished(self) -> bool:
+        return self.status == "finished"
+
+
+@dataclass
+class BatchReport:
+    batches: list[BatchResult] = field(default_factory=list)
+
+    @property
+    def total_operations(self) -> int:
+        return sum(batch.total_operations for batch in self.batches)
+
+    @property
+    def finished_operations(self) -> int:
+        return sum(batch.finished_operations for batch in self.batches)
+
+    @property
+    def errored_operations(self) -> int:
+        return sum(batch.errored_operations for batch in self.batches)
+
+    @property
+    def unfinished_batches(self) -> list[BatchResult]:
+        return [batch for batch in self.batches if not batch.finished]
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Seconds from the first submitted until the last completed batch."""
+        submitted_at = [b.submitted_at for b in self.batches if b.submitted_at]
+        completed_at = [b.completed_at for b in self.batches if b.completed_at]
+        if not submitted_at or not completed_at:
+            return None
+
+        return (max(completed_at) - min(submitted_at)).total_seconds()
+
+    @property
+    def operations_per_second(self) -> Optional[float]:
+        duration = self.duration
+        if not duration:
+            return None
+
+        return self.finished_operations / duration
+
+
+class BatchTracker:
+    def __init__(self, config: Config) -> None:
+        """Initialize the BatchTracker with a configuration.
+
+        Args:
+            config (Config): The configuration object containing API details.
+        """
+        self.config = config
+        self.batch_ids: list[str] = []
+        self._lock = threading.Lock()
+
+    def track(self, batch_ids: Iterable[str]) -> None:
+        """Record submitted batches which are waited for in `wait`."""
+        with self._lock:
+            self.batch_ids.extend(batch_ids)
+
+    def wait(self) -> BatchReport:
+        """Wait for all tracked batches to finish and report their results.
+
+        The batches are polled concurrently, each with an exponentially growing
+        interval. Batches which haven't finished within `config.batch_wait_timeout`
+        are reported with their last known status.
+        """
+        with self._lock:
+            batch_ids = list(self.batch_ids)
+        if not batch_ids:
+            return BatchReport()
+
+        with (
+            MailchimpService(self.config) as mailchimp_service,
+            ThreadPoolExecutor(
+                max_workers=self.config.max_concurrent_requests
+            ) as executor,
+        ):
+            batches = list(
+                executor.map(
+                    lambda batch_id: self._wait_for_batch(mailchimp_service, batch_id),
+                    batch_ids,
+                )
+            )
+
+        return BatchReport(batches)
+
+    def _wait_for_batch(
+        self, mailchimp_service: MailchimpService, batch_id: str
+    ) -> BatchResult:
+        def last_status(retry_state: RetryCallState) -> dict[str, Any]:
+            return retry_state.outcome.result()  # type: ignore[union-attr,no-any-return]
+
+        poll = Retrying(
+            retry=retry_if_result(lambda batch: batch["status"] != "finished"),
+            wait=wait_exponential(
+                multiplier=self.config.batch_poll_interval,
+                max=self.config.batch_max_poll_interval,
+            ),
+            stop=stop_after_delay(self.config.batch_wait_timeout),
+            retry_error_callback=last_status,
+        )
+        try:
+            batch = poll(mailchimp_service.get_batch, batch_id)
+        except Exception as e:
+            return BatchResult(
+                id=batch_id, status="unknown", errors=[{"error": repr(e)}]
+            )
+
+        result = BatchResult.from_response(batch)
+        if (
+            result.finished
+            and result.errored_operations
+            and batch.get("response_body_url")
+        ):
+            # the batch has finished even if its results can't be read
+            try:
+                result.errors = self._collect_errors(
+                    mailchimp_service, batch["response_body_url"]
+                )
+            except Exception as e:
+                result.errors = [{"error": repr(e)}]
+
+        return result
+
+    def _collect_errors(
+        self, mailchimp_service: MailchimpService, response_body_url: str
+    ) -> list[dict[str, Any]]:
+        errors = []
+        for operation_result in mailchimp_service.iter_batch_results(response_body_url):
+            if operation_result.get("status_code", 200) >= 400:
+                errors.append(operation_result)
+                if len(errors) >= MAX_REPORTED_ERRORS:
+                    break
+
+        return errors
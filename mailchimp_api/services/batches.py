@@ -0,0 +1,115 @@
+import json
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass, field
+from typing import Literal, TypedDict
+
+Operation = dict[str, str]
+
+
+class MemberTag(TypedDict):
+    name: str
+    status: Literal["active", "inactive"]
+
+
+def create_tag_operations(
+    list_id: str,
+    member_ids: list[str],
+    tag_name: str,
+    status: Literal["active", "inactive"],
+) -> list[Operation]:
+    """Create `/batches` operations that set a tag on each of the members."""
+    return [
+        {
+            "method": "POST",
+            "path": f"/lists/{list_id}/members/{member_id}/tags",
+            "body": json.dumps({"tags": [{"name": tag_name, "status": status}]}),
+        }
+        for member_id in member_ids
+    ]
+
+
+def create_member_tags_operations(
+    list_id: str, member_tags: Mapping[str, list[MemberTag]]
+) -> Iterator[Operation]:
+    """Create one `/batches` operation per member that applies all its tag changes."""
+    for member_id, tags in member_tags.items():
+        yield {
+            "method": "POST",
+            "path": f"/lists/{list_id}/members/{member_id}/tags",
+            "body": json.dumps({"tags": tags}),
+        }
+
+
+def pack_operations(
+    operations: Iterable[Operation],
+    max_operations: int,
+    max_payload_bytes: int,
+) -> Iterator[list[Operation]]:
+    """Pack operations into as few `/batches` requests as the limits allow.
+
+    Operations are taken in order and a chunk is closed as soon as adding the next
+    operation would exceed either the number of operations or the size of the
+    serialized `{"operations": [...]}` request body.
+
+    Args:
+        operations (Iterable[Operation]): The operations to pack.
+        max_operations (int): The maximum number of operations in a chunk.
+        max_payload_bytes (int): The maximum size of a chunk's request body.
+    """
+    empty_payload_bytes = len(json.dumps({"operations": []}))
+
+    chunk: list[Operation] = []
+    chunk_bytes = empty_payload_bytes
+    for operation in operations:
+        # every operation after the first one is preceded by ", "
+        operation_bytes = len(json.dumps(operation)) + (2 if chunk else 0)
+        if empty_payload_bytes + operation_bytes > max_payload_bytes:
+            raise ValueError(
+                f"Operation {operation['path']} does not fit into a batch request"
+            )
+
+        if chunk and (
+            len(chunk) >= max_operations
+            or chunk_bytes + operation_bytes > max_payload_bytes
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = empty_payload_bytes
+            operation_bytes -= 2
+
+        chunk.append(operation)
+        chunk_bytes += operation_bytes
+
+    if chunk:
+        yield chunk
+
+
+@dataclass
+class BatchChunkFailure:
+    operations: list[Operation]
+    error: BaseException
+
+
+class BatchSubmissionError(RuntimeError):
+    def __init__(self, submission: "BatchSubmission") -> None:
+        """Initialize the error with the submission that has failed chunks.
+
+        Args:
+            submission (BatchSubmission): The submission of all chunks.
+        """
+        self.submission = submission
+        super().__init__(
+            f"{len(submission.failures)} batch request(s) failed, first error: "
+            f"{submission.failures[0].error!r}"
+        )
+
+
+@dataclass
+class BatchSubmission:
+    batch_ids: list[str] = field(default_factory=list)
+    failures: list[BatchChunkFailure] = field(default_factory=list)
+
+    def raise_for_failures(self) -> None:
+        """Raise BatchSubmissionError if any of the chunks failed."""
+        if self.failures:
+            raise BatchSubmissionError(self)
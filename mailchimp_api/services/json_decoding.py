@@ -0,0 +1,35 @@
+import json
+from typing import Any, Callable, Literal
+
+JsonDecoder = Literal["json", "orjson"]
+
+
+def is_orjson_available() -> bool:
+    """Return whether the optional orjson package is installed."""
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def get_json_loads(decoder: JsonDecoder) -> Callable[[bytes], Any]:
+    """Return the function decoding a JSON response body with the given decoder.
+
+    Args:
+        decoder (JsonDecoder): "json" for the standard library, "orjson" for the
+            faster orjson package.
+
+    Raises:
+        ValueError: If orjson is requested but not installed.
+    """
+    if decoder == "json":
+        return json.loads
+
+    if not is_orjson_available():
+        raise ValueError("The orjson JSON decoder requires the orjson package")
+
+    import orjson
+
+    return orjson.loads  # type: ignore[no-any-return]
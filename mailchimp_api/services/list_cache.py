@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from ..config import Config
+
+
+class ListIndexCache:
+    """Caches the name to ID index of the lists of each account.
+
+    Indexes are kept in an in-process LRU cache and, when `config.list_cache_path`
+    is set, in a JSON file shared by all processes. Both expire after
+    `config.list_cache_ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 64) -> None:
+        """Initialize the ListIndexCache.
+
+        Args:
+            maxsize (int): The number of accounts kept in memory.
+        """
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # values are (expires_at, index), expires_at is a time.time() timestamp
+        self._indexes: OrderedDict[str, tuple[float, dict[str, str]]] = OrderedDict()
+
+    @staticmethod
+    def _key(config: Config) -> str:
+        # the API key is hashed so it is never written to disk
+        api_key_hash = hashlib.sha256(config.api_key.encode()).hexdigest()[:16]
+        return f"{config.base_url}#{api_key_hash}"
+
+    def get(self, config: Config) -> Optional[dict[str, str]]:
+        """Get the cached list index of the account, if it hasn't expired."""
+        key = self._key(config)
+        with self._lock:
+            if key in self._indexes:
+                expires_at, index = self._indexes[key]
+                if expires_at > time.time():
+                    self._indexes.move_to_end(key)
+                    return index
+                del self._indexes[key]
+
+        if config.list_cache_path is None:
+            return None
+
+        entry = self._read_file(config.list_cache_path).get(key)
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+
+        self._set_in_memory(key, entry["expires_at"], entry["index"])
+        return entry["index"]  # type: ignore[no-any-return]
+
+    def set(self, config: Config, index: dict[str, str]) -> None:
+        """Cache the list index of the account."""
+        key = self._key(config)
+        expires_at = time.time() + config.list_cache_ttl
+        self._set_in_memory(key, expires_at, index)
+
+        if config.list_cache_path is not None:
+            entries = self._read_file(config.list_cache_path)
+            entries[key] = {"expires_at": expires_at, "index": index}
+            self._write_file(config.list_cache_path, entries)
+
+    def invalidate(self, config: Config) -> None:
+        """Drop the cached list index of the account."""
+        key = self._key(config)
+        with self._lock:
+            self._indexes.pop(key, None)
+
+        if config.list_cache_path is not None:
+            entries = self._read_file(config.list_cache_path)
+            if entries.pop(key, None) is not None:
+                self._write_file(config.list_cache_path, entries)
+
+    def clear(self) -> None:
+        """Drop all indexes cached in memory."""
+        with self._lock:
+            self._indexes.clear()
+
+    def _set_in_memory(
+        self, key: str, expires_at: float, index: dict[str, str]
+    ) -> None:
+        with self._lock:
+            self._indexes[key] = (expires_at, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+
+    @staticmethod
+    def _read_file(path: Path) -> dict[str, Any]:
+        try:
+            return json.loads(path.read_text())  # type: ignore[no-any-return]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _write_file(path: Path, entries: dict[str, Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first so readers never see a partial file
+        tmp_path = path.with_suffix(f"{path.suffix}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(entries))
+        tmp_path.replace(path)
+
+
+list_index_cache = ListIndexCache()
+
+
+def create_list_index(account_lists: dict[str, Any]) -> dict[str, str]:
+    """Map list names to IDs, the first list wins if names are duplicated."""
+    index: dict[str, str] = {}
+    for account_list in account_lists["lists"]:
+        index.setdefault(account_list["name"], account_list["id"])
+
+    return index
@@ -1,10 +1,37 @@
+import hashlib
 import json
-from typing import Any, Literal
+import tarfile
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from types import TracebackType
+from typing import Any, Literal, Optional
+from urllib.parse import quote
 
 import requests
-from tenacity import retry, stop_after_attempt, wait_exponential
+from requests.adapters import HTTPAdapter
 
-from ..config import Config
+from ..config import MAX_LISTS_PAGE_SIZE, Config
+from .batches import (
+    BatchChunkFailure,
+    BatchSubmission,
+    Operation,
+    create_tag_operations,
+    pack_operations,
+)
+from .json_decoding import get_json_loads
+from .list_cache import create_list_index, list_index_cache
+from .request_scheduler import RequestScheduler, get_retry_after, scheduled_retry
+
+
+def get_subscriber_hash(email: str) -> str:
+    """Return the hash identifying the list member with the given email.
+
+    Args:
+        email (str): The email address of the member.
+    """
+    return hashlib.md5(email.lower().encode(), usedforsecurity=False).hexdigest()
 
 
 class MailchimpService:
@@ -15,42 +42,280 @@ class MailchimpService:
             config (Config): The configuration object containing API details.
         """
         self.config = config
+        self.session = self._create_session()
+        self._json_loads = get_json_loads(config.json_decoder)
+        # requests of all services using the same API key are paced together
+        self.scheduler = RequestScheduler.for_api_key(
+            config.api_key,
+            requests_per_second=config.requests_per_second,
+            max_in_flight=config.max_concurrent_requests,
+        )
 
-    @retry(
-        stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10)
-    )
-    def _mailchim_request_get(self, url: str) -> dict[str, list[dict[str, str]]]:
-        response = requests.get(url, headers=self.config.headers, timeout=10)
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self.config.headers)
 
-        if response.status_code < 200 or response.status_code >= 300:
-            # This automatically raises an HTTPError with details
-            response.raise_for_status()
+        # keep-alive connections are reused across requests, blocking when all
+        # connections to a host are busy
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
 
-        return response.json()  # type: ignore[no-any-return]
+        return session
 
-    def _mailchimp_request_post(self, url: str, body: dict[str, Any]) -> dict[str, Any]:
-        response = requests.post(
-            url, headers=self.config.headers, json=body, timeout=10
-        )
+    def close(self) -> None:
+        """Close the HTTP session and its pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> "MailchimpService":
+        """Enter the context, the session is closed on exit."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        """Close the session when leaving the context."""
+        self.close()
+
+    def _decode(self, response: requests.Response) -> Any:
+        # most of the decoding time is spent on the large pages of members
+        if self.config.json_decoder == "json":
+            return response.json()
+        return self._json_loads(response.content)
+
+    def _raise_for_status(self, response: requests.Response) -> None:
+        if response.status_code == 429:
+            self.scheduler.record_throttled(get_retry_after(response))
 
         # Check if the response is not 200-299
         if response.status_code < 200 or response.status_code >= 300:
             # This automatically raises an HTTPError with details
             response.raise_for_status()
 
+    @scheduled_retry
+    def _mailchim_request_get(self, url: str) -> dict[str, list[dict[str, str]]]:
+        with self.scheduler.slot():
+            response = self.session.get(url, timeout=self.config.timeout)
+
+        self._raise_for_status(response)
+
+        return self._decode(response)  # type: ignore[no-any-return]
+
+    def _mailchimp_request_post(self, url: str, body: dict[str, Any]) -> dict[str, Any]:
+        with self.scheduler.slot():
+            response = self.session.post(url, json=body, timeout=self.config.timeout)
+
+        self._raise_for_status(response)
+
         return response.json()  # type: ignore[no-any-return]
 
     def get_account_lists(self) -> dict[str, list[dict[str, str]]]:
-        """Get information about all lists in the account."""
-        url = f"{self.config.base_url}/lists?fields=lists.id,lists.name"
+        """Get information about all lists in the account.
 
-        return self._mailchim_request_get(url)
+        Mailchimp returns only 10 lists by default, so pages of lists are requested
+        until `total_items` lists have been read.
+        """
+        lists: list[dict[str, str]] = []
+        while True:
+            url = f"{self.config.base_url}/lists?fields=lists.id,lists.name,total_items&count={MAX_LISTS_PAGE_SIZE}&offset={len(lists)}"
+            page: dict[str, Any] = self._mailchim_request_get(url)
+            page_lists = page.get("lists", [])
+            lists.extend(page_lists)
+            if not page_lists or len(lists) >= page.get("total_items", 0):
+                return {"lists": lists}
+
+    def get_list_ids(self, refresh: bool = False) -> dict[str, str]:
+        """Get the IDs of all lists in the account by their names.
+
+        Args:
+            refresh (bool): Fetch the lists even if they are cached.
+        """
+        index = None if refresh else list_index_cache.get(self.config)
+        if index is None:
+            index = create_list_index(self.get_account_lists())
+            list_index_cache.set(self.config, index)
+
+        return index
+
+    def get_list_id(self, list_name: str) -> str:
+        """Get the ID of the list with the given name.
 
-    def get_members_with_tags(self, list_id: str) -> dict[str, Any]:
-        url = f"{self.config.base_url}/lists/{list_id}/members?fields=members.id,members.email_address,members.tags"
+        The index of the account's lists is cached and fetched again when the name
+        is not found in the cached index.
+
+        Args:
+            list_name (str): The name of the list.
+        """
+        index = self.get_list_ids()
+        if list_name not in index:
+            index = self.get_list_ids(refresh=True)
+
+        if list_name not in index:
+            raise ValueError(f"List {list_name} not found in account lists.")
+
+        return index[list_name]
+
+    def get_members_with_tags(
+        self,
+        list_id: str,
+        count: int,
+        offset: int = 0,
+        since_last_changed: Optional[str] = None,
+    ) -> dict[str, Any]:
+        url = f"{self.config.base_url}/lists/{list_id}/members?fields=members.id,members.email_address,members.tags.name,total_items&count={count}&offset={offset}"
+        if since_last_changed is not None:
+            url += f"&since_last_changed={quote(since_last_changed)}"
 
         return self._mailchim_request_get(url)
 
+    def iter_members_with_tags(
+        self, list_id: str, since_last_changed: Optional[str] = None
+    ) -> Iterator[list[dict[str, Any]]]:
+        """Yield pages of list members together with their tags.
+
+        Pages of `config.members_page_size` members are requested until
+        `total_items` members have been read. When `config.max_concurrent_requests`
+        is greater than one, the pages after the first one are fetched concurrently
+        and still yielded in order.
+
+        Args:
+            list_id (str): The ID of the list.
+            since_last_changed (Optional[str]): Only members changed after this ISO
+                8601 time are returned, all members if None.
+        """
+        if self.config.max_concurrent_requests > 1:
+            yield from self._iter_members_with_tags_concurrently(
+                list_id, since_last_changed
+            )
+            return
+
+        offset = 0
+        while True:
+            page = self.get_members_with_tags(
+                list_id,
+                count=self.config.members_page_size,
+                offset=offset,
+                since_last_changed=since_last_changed,
+            )
+            members = page.get("members", [])
+            if members:
+                yield members
+
+            offset += len(members)
+            if not members or offset >= page.get("total_items", 0):
+                return
+
+    def _iter_members_with_tags_concurrently(
+        self, list_id: str, since_last_changed: Optional[str]
+    ) -> Iterator[list[dict[str, Any]]]:
+        page_size = self.config.members_page_size
+        max_workers = self.config.max_concurrent_requests
+
+        # the first page tells us how many members there are
+        first_page = self.get_members_with_tags(
+            list_id, count=page_size, since_last_changed=since_last_changed
+        )
+        members = first_page.get("members", [])
+        if not members:
+            return
+        yield members
+
+        offsets = iter(range(page_size, first_page.get("total_items", 0), page_size))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # at most max_workers pages are in flight or waiting to be yielded
+            pending = deque(
+                executor.submit(
+                    self.get_members_with_tags,
+                    list_id,
+                    page_size,
+                    offset,
+                    since_last_changed,
+                )
+                for offset in islice(offsets, max_workers)
+            )
+            while pending:
+                page = pending.popleft().result()
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    pending.append(
+                        executor.submit(
+                            self.get_members_with_tags,
+                            list_id,
+                            page_size,
+                            next_offset,
+                            since_last_changed,
+                        )
+                    )
+
+                members = page.get("members", [])
+                if members:
+                    yield members
+
+    def get_member_count(self, list_id: str) -> int:
+        """Get the number of members of the list."""
+        url = (
+            f"{self.config.base_url}/lists/{list_id}/members?fields=total_items&count=1"
+        )
+
+        page: dict[str, Any] = self._mailchim_request_get(url)
+        return int(page.get("total_items", 0))
+
+    @scheduled_retry
+    def get_member_with_tags(
+        self, list_id: str, email: str
+    ) -> Optional[dict[str, Any]]:
+        """Get the list member with the given email together with its tags.
+
+        Args:
+            list_id (str): The ID of the list.
+            email (str): The email address of the member.
+
+        Returns:
+            The member, None if the email is not a member of the list.
+        """
+        url = f"{self.config.base_url}/lists/{list_id}/members/{get_subscriber_hash(email)}?fields=id,email_address,tags.name"
+
+        with self.scheduler.slot():
+            response = self.session.get(url, timeout=self.config.timeout)
+
+        if response.status_code == 404:
+            return None
+        self._raise_for_status(response)
+
+        return self._decode(response)  # type: ignore[no-any-return]
+
+    def iter_members_with_tags_by_email(
+        self, list_id: str, emails: Iterable[str]
+    ) -> Iterator[list[dict[str, Any]]]:
+        """Yield pages of the list members with the given emails and their tags.
+
+        Members are looked up by their subscriber hash, up to
+        `config.max_concurrent_requests` at the same time. Emails which are not
+        members of the list are skipped.
+
+        Args:
+            list_id (str): The ID of the list.
+            emails (Iterable[str]): The emails of the members.
+        """
+        emails = iter(emails)
+        with ThreadPoolExecutor(
+            max_workers=self.config.max_concurrent_requests
+        ) as executor:
+            while chunk := list(islice(emails, self.config.members_page_size)):
+                members = executor.map(
+                    lambda email: self.get_member_with_tags(list_id, email), chunk
+                )
+                page = [member for member in members if member is not None]
+                if page:
+                    yield page
+
     def get_members(self, list_id: str) -> dict[str, list[dict[str, str]]]:
         url = f"{self.config.base_url}/lists/{list_id}/members?fields=members.email_address,members.id"
 
@@ -61,31 +326,90 @@ class MailchimpService:
 
         return self._mailchim_request_get(url)
 
-    @retry(
-        stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10)
-    )
-    def _post_batch_update_members_tag(
-        self,
-        list_id: str,
-        member_ids: list[str],
-        tag_name: str,
-        status: Literal["active", "inactive"],
-    ) -> dict[str, str]:
+    @scheduled_retry
+    def _post_batch(self, operations: list[Operation]) -> dict[str, Any]:
         url = f"{self.config.base_url}/batches"
-        body = {
-            "operations": [
-                {
-                    "method": "POST",
-                    "path": f"/lists/{list_id}/members/{member_id}/tags",
-                    "body": json.dumps(
-                        {"tags": [{"name": tag_name, "status": status}]}
-                    ),
-                }
-                for member_id in member_ids
-            ]
-        }
+        body = {"operations": operations}
         return self._mailchimp_request_post(url, body)
 
+    def submit_batches(self, chunks: Iterable[list[Operation]]) -> BatchSubmission:
+        """Post each chunk of operations as a separate `/batches` request.
+
+        Chunks are posted as soon as they are produced, up to
+        `config.max_concurrent_requests` at the same time, and the next chunk is only
+        taken when one of them completes. A chunk which still fails after retrying
+        doesn't stop the others, it is reported in the returned submission instead.
+
+        Args:
+            chunks (Iterable[list[Operation]]): The chunks of batch operations.
+        """
+        submission = BatchSubmission()
+        max_workers = self.config.max_concurrent_requests
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending: deque[tuple[list[Operation], Future[dict[str, Any]]]] = deque()
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(self._post_batch, chunk)))
+                if len(pending) >= max_workers:
+                    self._collect_batch(submission, *pending.popleft())
+            while pending:
+                self._collect_batch(submission, *pending.popleft())
+
+        return submission
+
+    def _collect_batch(
+        self,
+        submission: BatchSubmission,
+        chunk: list[Operation],
+        future: "Future[dict[str, Any]]",
+    ) -> None:
+        error = future.exception()
+        if error is not None:
+            submission.failures.append(BatchChunkFailure(chunk, error))
+        elif "id" in (response := future.result()):
+            submission.batch_ids.append(response["id"])
+
+    def submit_operations(self, operations: Iterable[Operation]) -> BatchSubmission:
+        """Pack operations into as few `/batches` requests as possible and post them.
+
+        Args:
+            operations (Iterable[Operation]): The batch operations.
+        """
+        chunks = pack_operations(
+            operations,
+            max_operations=self.config.batch_max_operations,
+            max_payload_bytes=self.config.batch_max_payload_bytes,
+        )
+        return self.submit_batches(chunks)
+
+    def get_batch(self, batch_id: str) -> dict[str, Any]:
+        """Get the status of a batch request."""
+        url = f"{self.config.base_url}/batches/{batch_id}?fields=id,status,total_operations,finished_operations,errored_operations,submitted_at,completed_at,response_body_url"
+
+        return self._mailchim_request_get(url)
+
+    def iter_batch_results(self, response_body_url: str) -> Iterator[dict[str, Any]]:
+        """Stream the results of the operations of a finished batch request.
+
+        The results are a gzipped tar archive of JSON files, each holding a list of
+        operation results. The archive is read while it is being downloaded.
+
+        Args:
+            response_body_url (str): The `response_body_url` of the finished batch.
+        """
+        # the URL is pre-signed, so the Mailchimp authorization header is not sent
+        with self.session.get(
+            response_body_url,
+            headers={"Authorization": None},  # type: ignore[dict-item]
+            stream=True,
+            timeout=self.config.timeout,
+        ) as response:
+            response.raise_for_status()
+            with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                for member in archive:
+                    results_file = archive.extractfile(member)
+                    if results_file is not None:
+                        yield from json.load(results_file)
+
     def post_batch_update_members_tag(
         self,
         list_id: str,
@@ -93,9 +417,8 @@ class MailchimpService:
         tag_name: str,
         status: Literal["active", "inactive"] = "active",
     ) -> dict[str, str]:
-        # Split member_ids into chunks of 200
-        for i in range(0, len(member_ids), 200):
-            self._post_batch_update_members_tag(
-                list_id, member_ids[i : i + 200], tag_name, status
-            )
+        operations = create_tag_operations(list_id, member_ids, tag_name, status)
+        submission = self.submit_operations(operations)
+        submission.raise_for_failures()
+
         return {"status": "success"}
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, ClassVar, Optional, TypeVar
+
+import httpx
+import requests
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+from tenacity.wait import wait_base
+
+MAX_ATTEMPTS = 5
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+T = TypeVar("T")
+
+
+@dataclass
+class SchedulerStats:
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    failures: int = 0
+
+
+class RequestScheduler:
+    """Paces the requests sent with a single API key.
+
+    Requests are spread out according to a token bucket refilled with
+    `requests_per_second` tokens and holding up to `max_in_flight` of them, and at
+    most `max_in_flight` requests are sent at the same time, counting the requests
+    of threads and of event loops together. After a 429 response no request is
+    sent until the `Retry-After` period is over.
+    """
+
+    _schedulers: ClassVar[dict[str, "RequestScheduler"]] = {}
+    _schedulers_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, requests_per_second: float, max_in_flight: int) -> None:
+        """Initialize the RequestScheduler.
+
+        Args:
+            requests_per_second (float): The sustained number of requests per second.
+            max_in_flight (int): The maximum number of requests sent at the same time,
+                also the size of a burst of requests.
+        """
+        self.requests_per_second = requests_per_second
+        self.max_in_flight = max_in_flight
+        self.stats = SchedulerStats()
+
+        self._interval = 1 / requests_per_second
+        self._burst = (max_in_flight - 1) * self._interval
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._slot_released = threading.Condition(self._lock)
+        # async requests waiting for a slot, woken on their own event loop
+        self._async_waiters: list[
+            tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]
+        ] = []
+        # the theoretical arrival time of the next request, as in GCRA
+        self._next_arrival = 0.0
+        self._resume_at = 0.0
+
+    @classmethod
+    def for_api_key(
+        cls, api_key: str, requests_per_second: float, max_in_flight: int
+    ) -> "RequestScheduler":
+        """Get the scheduler shared by all services using the API key.
+
+        The limits are only used when the first scheduler for the key is created.
+        """
+        with cls._schedulers_lock:
+            if api_key not in cls._schedulers:
+                cls._schedulers[api_key] = cls(requests_per_second, max_in_flight)
+            return cls._schedulers[api_key]
+
+    def reserve(self) -> float:
+        """Reserve a token and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_arrival - self._burst, self._resume_at)
+            self._next_arrival = max(self._next_arrival, send_at) + self._interval
+            self.stats.requests += 1
+            return send_at - now
+
+    def _acquire(self) -> None:
+        with self._slot_released:
+            self._slot_released.wait_for(lambda: self._in_flight < self.max_in_flight)
+            self._in_flight += 1
+
+    async def _acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._in_flight < self.max_in_flight:
+                    self._in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            # woken by every release, the free slot may be taken by someone else
+            await waiter
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._slot_released.notify()
+            async_waiters, self._async_waiters = self._async_waiters, []
+
+        for loop, waiter in async_waiters:
+            # the event loop of a cancelled request may already be closed
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Wait for a token and a free in-flight slot, blocking the thread."""
+        self._acquire()
+        try:
+            time.sleep(self.reserve())
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        """Wait for a token and a free in-flight slot without blocking the loop."""
+        await self._acquire_async()
+        try:
+            await asyncio.sleep(self.reserve())
+            yield
+        finally:
+            self._release()
+
+    def record_throttled(self, retry_after: Optional[float]) -> None:
+        """Record a 429 response, pausing all requests for `retry_after` seconds."""
+        with self._lock:
+            self.stats.throttled += 1
+            if retry_after is not None:
+                self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.stats.retries += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.stats.failures += 1
+
+
+def _wake(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def get_retry_after(response: Any) -> Optional[float]:
+    """Get the seconds to wait from the `Retry-After` header of a response."""
+    value: Optional[str] = (
+        response.headers.get("Retry-After") if response is not None else None
+    )
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _get_status_code(exception: BaseException) -> Optional[int]:
+    response = getattr(exception, "response", None)
+    status_code: Optional[int] = getattr(response, "status_code", None)
+    return status_code
+
+
+def is_retryable(exception: BaseException) -> bool:
+    """Whether a failed request may succeed when it is sent again."""
+    if isinstance(exception, (requests.HTTPError, httpx.HTTPStatusError)):
+        return _get_status_code(exception) in RETRYABLE_STATUS_CODES
+
+    return isinstance(
+        exception,
+        (requests.ConnectionError, requests.Timeout, httpx.TransportError),
+    )
+
+
+class wait_retry_after(wait_base):  # noqa: N801
+    """Wait as long as `Retry-After` asks to, falling back to another strategy."""
+
+    def __init__(self, fallback: wait_base) -> None:
+        """Initialize the wait strategy.
+
+        Args:
+            fallback (wait_base): The strategy used without a `Retry-After` header.
+        """
+        self.fallback = fallback
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        """Get the seconds to wait before the next attempt."""
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        retry_after = get_retry_after(getattr(exception, "response", None))
+        if retry_after is not None:
+            return retry_after
+
+        return self.fallback(retry_state)
+
+
+def _record_retry(retry_state: RetryCallState) -> None:
+    # the decorated methods belong to services which own a scheduler
+    retry_state.args[0].scheduler.record_retry()
+
+
+def scheduled_retry(func: Callable[..., T]) -> Callable[..., T]:
+    """Retry a request method of a service on retryable errors only.
+
+    Throttled requests are retried after `Retry-After`, other retryable errors with
+    an exponential backoff. The error of the last attempt is raised and counted as
+    a failure.
+    """
+    retrying: Callable[..., Any] = retry(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_retry_after(wait_exponential(multiplier=1, min=1, max=10)),
+        stop=stop_after_attempt(MAX_ATTEMPTS),
+        before_sleep=_record_retry,
+        reraise=True,
+    )(func)
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            try:
+                return await retrying(self, *args, **kwargs)
+            except Exception:
+                self.scheduler.record_failure()
+                raise
+
+        return async_wrapper  # type: ignore[return-value]
+
+    @functools.wraps(func)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return retrying(self, *args, **kwargs)
+        except Exception:
+            self.scheduler.record_failure()
+            raise
+
+    return wrapper
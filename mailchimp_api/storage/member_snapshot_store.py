@@ -0,0 +1,154 @@
+import json
+import sqlite3
+from collections.abc import Iterator, Mapping
+from datetime import datetime, timezone
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional
+
+from ..services.batches import MemberTag
+from ..services.mailchimp_service import MailchimpService
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    id TEXT PRIMARY KEY,
+    email_address TEXT NOT NULL,
+    tags TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class MemberSnapshotStore:
+    """A local SQLite copy of the members of a list together with their tags.
+
+    The snapshot is kept up to date with `sync`, which after the first full download
+    only requests the members changed since the previous sync. Members permanently
+    deleted from Mailchimp are not removed from the snapshot.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Open the snapshot, creating it if it doesn't exist.
+
+        Args:
+            path (Path): The SQLite database file of the snapshot.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    @classmethod
+    def for_list(cls, snapshot_dir: Path, list_id: str) -> "MemberSnapshotStore":
+        """Open the snapshot of a list in the snapshot directory."""
+        return cls(snapshot_dir / f"members-{list_id}.sqlite3")
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+    def __enter__(self) -> "MemberSnapshotStore":
+        """Enter the context, the connection is closed on exit."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        """Close the connection when leaving the context."""
+        self.close()
+
+    @property
+    def last_synced_at(self) -> Optional[str]:
+        """The start time of the last successful sync, None if never synced."""
+        row = self.connection.execute(
+            "SELECT value FROM sync_state WHERE key = 'last_synced_at'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def upsert_members(self, members: list[dict[str, Any]]) -> None:
+        """Insert new members and replace the email and tags of existing ones."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO members (id, email_address, tags) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "email_address = excluded.email_address, tags = excluded.tags",
+                [
+                    (member["id"], member["email_address"], json.dumps(member["tags"]))
+                    for member in members
+                ],
+            )
+
+    def apply_tag_changes(self, member_tags: Mapping[str, list[MemberTag]]) -> None:
+        """Apply tag changes submitted to Mailchimp to the snapshot.
+
+        Mailchimp isn't relied on to report members whose tags were changed as
+        changed in the next sync, so the changes are written to the snapshot too.
+
+        Args:
+            member_tags (Mapping[str, list[MemberTag]]): The tags set active or
+                inactive by member ID.
+        """
+        with self.connection:
+            for member_id, changes in member_tags.items():
+                row = self.connection.execute(
+                    "SELECT tags FROM members WHERE id = ?", (member_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+
+                inactive = {
+                    tag["name"] for tag in changes if tag["status"] == "inactive"
+                }
+                tags = [
+                    tag for tag in json.loads(row[0]) if tag["name"] not in inactive
+                ]
+                names = {tag["name"] for tag in tags}
+                for tag in changes:
+                    if tag["status"] == "active" and tag["name"] not in names:
+                        tags.append({"name": tag["name"]})
+                        names.add(tag["name"])
+
+                self.connection.execute(
+                    "UPDATE members SET tags = ? WHERE id = ?",
+                    (json.dumps(tags), member_id),
+                )
+
+    def iter_members(self, page_size: int) -> Iterator[list[dict[str, Any]]]:
+        """Yield pages of members in the same shape as the Mailchimp API returns."""
+        cursor = self.connection.execute(
+            "SELECT id, email_address, tags FROM members ORDER BY rowid"
+        )
+        while rows := cursor.fetchmany(page_size):
+            yield [
+                {"id": member_id, "email_address": email, "tags": json.loads(tags)}
+                for member_id, email, tags in rows
+            ]
+
+    def sync(self, mailchimp_service: MailchimpService, list_id: str) -> int:
+        """Bring the snapshot up to date and return the number of fetched members.
+
+        Members changed since the start of the previous sync are fetched using the
+        `since_last_changed` filter, all members on the first sync.
+        """
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        fetched = 0
+        for members in mailchimp_service.iter_members_with_tags(
+            list_id, since_last_changed=self.last_synced_at
+        ):
+            self.upsert_members(members)
+            fetched += len(members)
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('last_synced_at', ?)",
+                (started_at,),
+            )
+
+        return fetched
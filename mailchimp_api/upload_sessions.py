@@ -0,0 +1,111 @@
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Literal, Optional
+
+UploadState = Literal["waiting", "uploaded"]
+
+
+@dataclass
+class UploadSession:
+    """An upload a workflow is waiting for."""
+
+    id: str
+    created_at: float = field(default_factory=time.monotonic)
+    state: UploadState = "waiting"
+    file: Optional[BinaryIO] = None
+    uploaded: threading.Event = field(default_factory=threading.Event)
+
+
+class UploadSessionRegistry:
+    """Hands the uploaded files over from the `/upload` endpoint to the workflows.
+
+    Every workflow waiting for a file gets its own session with a unique ID. When the
+    file is uploaded to an endpoint in the same process, it is handed over in memory
+    or in a temporary file and the workflow is woken up immediately. Files saved by
+    an endpoint running in another process are still noticed by checking for the
+    file every `poll_interval` seconds.
+    """
+
+    def __init__(self, poll_interval: float = 1.0) -> None:
+        """Initialize the registry.
+
+        Args:
+            poll_interval (float): Seconds between checks whether the file exists.
+        """
+        self.poll_interval = poll_interval
+        self._sessions: dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> UploadSession:
+        """Start a session before its upload link is handed out to the user."""
+        session = UploadSession(id=uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.id] = session
+
+        return session
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        """Return the session, None if it isn't open in this process."""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def complete(self, session_id: str, file: BinaryIO) -> bool:
+        """Hand the uploaded file over to the workflow waiting for it.
+
+        Args:
+            session_id (str): The ID of the session.
+            file (BinaryIO): The uploaded file, owned by the session from now on.
+
+        Returns:
+            Whether the file was accepted, False if the session is not waiting for
+            a file (anymore).
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.state != "waiting":
+                return False
+            session.file = file
+            session.state = "uploaded"
+
+        session.uploaded.set()
+        return True
+
+    def wait(self, session_id: str, path: Path, timeout: float) -> Optional[BinaryIO]:
+        """Wait for the file uploaded in the session.
+
+        Args:
+            session_id (str): The ID of the session.
+            path (Path): Where an endpoint in another process saves the file.
+            timeout (float): Seconds to wait for the file.
+
+        Returns:
+            The uploaded file, None if it wasn't uploaded before the timeout.
+        """
+        session = self.get(session_id)
+        if session is None:
+            raise ValueError(f"Upload session {session_id} not found")
+
+        deadline = time.monotonic() + timeout
+        while session.file is None:
+            if path.exists():
+                return path.open("rb")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            session.uploaded.wait(min(self.poll_interval, remaining))
+
+        return session.file
+
+    def close(self, session_id: str) -> None:
+        """End the session and release its file."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None and session.file is not None:
+            session.file.close()
+
+
+upload_sessions = UploadSessionRegistry()
@@ -1,14 +1,22 @@
 import os
-import time
-from typing import Any
+from pathlib import Path
+from typing import Any, Literal, Optional, Union
 
-import pandas as pd
 from fastagency import UI
 from fastagency.runtimes.autogen import AutoGenWorkflows
 
 from .config import Config
-from .constants import UPLOADED_FILES_DIR
-from .processing.update_tags import update_tags
+from .constants import UPLOADED_FILES_DIR, UPLOAD_TIMEOUT
+from .processing.crm_file import get_crm_file_suffixes, read_crm_emails
+from .processing.tag_rules import TagTransitionRules
+from .processing.update_tags import (
+    ListUpdateSummary,
+    update_tags,
+    update_tags_for_lists,
+)
+from .services.batch_tracker import BatchReport, BatchTracker
+from .services.json_decoding import is_orjson_available
+from .upload_sessions import upload_sessions
 
 wf = AutoGenWorkflows()
 
@@ -20,31 +28,141 @@ def _get_config() -> Config:
     if not api_key:
         raise ValueError("MAILCHIMP_API_KEY not set")
 
-    config = Config("us14", api_key)
+    list_cache_path = os.getenv("MAILCHIMP_LIST_CACHE_PATH")
+    snapshot_dir = os.getenv("MAILCHIMP_SNAPSHOT_DIR")
+    tag_rules_path = os.getenv("MAILCHIMP_TAG_RULES_PATH")
+    config = Config(
+        "us14",
+        api_key,
+        list_cache_path=Path(list_cache_path) if list_cache_path else None,
+        snapshot_dir=Path(snapshot_dir) if snapshot_dir else None,
+        json_decoder="orjson" if is_orjson_available() else "json",
+        tag_rules=TagTransitionRules.load(Path(tag_rules_path))
+        if tag_rules_path
+        else None,
+    )
     return config
 
 
 config = _get_config()
 
+MAX_SAMPLE_MEMBER_IDS = 3
+
 
-def _wait_for_file(timestamp: str) -> pd.DataFrame:
-    file_name = f"uploaded-file-{timestamp}.csv"
+def _wait_for_file(session_id: str) -> Optional[set[str]]:
+    file_name = f"uploaded-file-{session_id}"
     file_path = UPLOADED_FILES_DIR / file_name
-    while not file_path.exists():
-        time.sleep(2)
+    try:
+        file = upload_sessions.wait(session_id, file_path, timeout=UPLOAD_TIMEOUT)
+        if file is None:
+            return None
+
+        with file:
+            return read_crm_emails(file)
+    finally:
+        upload_sessions.close(session_id)
+        file_path.unlink(missing_ok=True)
+
+
+def _format_batch_report(batch_report: BatchReport) -> str:
+    body = f"""Mailchimp batch results:
+
+- **Finished operations**: {batch_report.finished_operations} of {batch_report.total_operations}
+- **Errored operations**: {batch_report.errored_operations}
+"""
+    if batch_report.unfinished_batches:
+        body += f"- **Unfinished batches**: {len(batch_report.unfinished_batches)}\n"
+    if batch_report.operations_per_second is not None:
+        body += (
+            f"- **Throughput**: {batch_report.operations_per_second:.1f} operations/s\n"
+        )
+
+    return body
+
+
+def _parse_list_names(answer: str) -> Union[list[str], Literal["all"]]:
+    if answer.strip().lower() == "all":
+        return "all"
+
+    return [name.strip() for name in answer.split(",") if name.strip()]
+
+
+def _format_updates_per_tag(add_tag_members: dict[str, list[str]]) -> str:
+    add_tag_members = dict(sorted(add_tag_members.items()))
+    return "\n".join(
+        [f"- **{key}**: {len(value)}" for key, value in add_tag_members.items()]
+    )
+
+
+def _format_list_summaries(summaries: list[ListUpdateSummary]) -> str:
+    sections = []
+    for summary in summaries:
+        if summary.error is not None:
+            updates = f"Failed: {summary.error}"
+        elif summary.add_tag_members:
+            updates = _format_updates_per_tag(summary.add_tag_members)
+        else:
+            updates = "No tags added"
+        sections.append(
+            f"Number of updates per tag in **{summary.list_name}**:\n\n{updates}"
+        )
+
+    return (
+        "\n\n".join(sections)
+        + "\n\n(It might take some time for updates to reflect in Mailchimp)\n"
+    )
+
+
+def _format_tag_members_diff(tag_members: dict[str, list[str]]) -> str:
+    lines = []
+    for tag_name, member_ids in sorted(tag_members.items()):
+        sample = ", ".join(member_ids[:MAX_SAMPLE_MEMBER_IDS])
+        if len(member_ids) > MAX_SAMPLE_MEMBER_IDS:
+            sample += ", ..."
+        lines.append(f"- **{tag_name}**: {len(member_ids)} ({sample})")
+    return "\n".join(lines)
+
 
-    df = pd.read_csv(file_path)
-    file_path.unlink()
+def _format_dry_run(summaries: list[ListUpdateSummary]) -> str:
+    sections = []
+    for summary in summaries:
+        if summary.error is not None:
+            plan = f"Failed: {summary.error}"
+        elif not summary.add_tag_members:
+            plan = "No tags would be added"
+        else:
+            plan = f"""Tags to add:
 
-    return df
+{_format_tag_members_diff(summary.add_tag_members)}
+
+Tags to remove:
+
+{_format_tag_members_diff(summary.remove_tag_members)}
+
+Estimated `/batches` requests: {summary.batch_requests} with {summary.operations} operations"""
+        sections.append(f"Dry run for **{summary.list_name}**:\n\n{plan}")
+
+    return "\n\n".join(sections) + "\n"
+
+
+def _format_file_suffixes(suffixes: list[str]) -> str:
+    formatted = [f"**{suffix}**" for suffix in suffixes]
+    if len(formatted) == 1:
+        return formatted[0]
+    return ", ".join(formatted[:-1]) + " or " + formatted[-1]
+
+
+def _ask_yes_no(ui: UI, prompt: str) -> bool:
+    answer = ui.text_input(sender="Workflow", recipient="User", prompt=prompt)
+    return answer is not None and answer.strip().lower() in ("y", "yes")
 
 
 @wf.register(name="mailchimp_chat", description="Mailchimp tags update chat")  # type: ignore[misc]
 def mailchimp_chat(ui: UI, params: dict[str, Any]) -> str:
-    timestamp = time.strftime("%Y-%m-%d-%H-%M-%S")
-    body = f"""Please upload **.csv** file with the email addresses for which you want to update the tags.
+    session_id = upload_sessions.create().id
+    body = f"""Please upload a {_format_file_suffixes(get_crm_file_suffixes())} file with the email addresses for which you want to update the tags.
 
-<a href="{FASTAPI_URL}/upload-file?timestamp={timestamp}" target="_blank">Upload File</a>
+<a href="{FASTAPI_URL}/upload-file?session_id={session_id}" target="_blank">Upload File</a>
 """
     ui.text_message(
         sender="Workflow",
@@ -52,35 +170,74 @@ def mailchimp_chat(ui: UI, params: dict[str, Any]) -> str:
         body=body,
     )
 
-    df = _wait_for_file(timestamp)
+    crm_emails = _wait_for_file(session_id)
+    if crm_emails is None:
+        return "File upload timed out"
 
-    list_name = None
-    while list_name is None:
-        list_name = ui.text_input(
+    list_names = None
+    while not list_names:
+        answer = ui.text_input(
             sender="Workflow",
             recipient="User",
-            prompt="Please enter Account Name for which you want to update the tags",
+            prompt="Please enter Account Name for which you want to update the tags (separate several names with commas or enter 'all' for every account)",
         )
+        list_names = _parse_list_names(answer) if answer is not None else None
+
+    if _ask_yes_no(
+        ui,
+        "Do you want to see the planned updates before they are applied? (yes/no)",
+    ):
+        summaries = update_tags_for_lists(
+            crm_emails=crm_emails,
+            config=config,
+            list_names=list_names,
+            dry_run=True,
+        )
+        ui.text_message(
+            sender="Workflow",
+            recipient="User",
+            body=_format_dry_run(summaries),
+        )
+        if not _ask_yes_no(ui, "Do you want to apply these updates? (yes/no)"):
+            return "Dry run completed"
+
+    batch_tracker = BatchTracker(config)
+    if list_names != "all" and len(list_names) == 1:
+        add_tag_members, _ = update_tags(
+            crm_emails=crm_emails,
+            config=config,
+            list_name=list_names[0],
+            batch_tracker=batch_tracker,
+        )
+        if not add_tag_members:
+            return "No tags added"
 
-    add_tag_members, _ = update_tags(
-        crm_df=df, config=config, list_name=list_name.strip()
-    )
-    if not add_tag_members:
-        return "No tags added"
-
-    add_tag_members = dict(sorted(add_tag_members.items()))
-    updates_per_tag = "\n".join(
-        [f"- **{key}**: {len(value)}" for key, value in add_tag_members.items()]
-    )
-    body = f"""Number of updates per tag:
+        body = f"""Number of updates per tag:
 
-{updates_per_tag}
+{_format_updates_per_tag(add_tag_members)}
 
 (It might take some time for updates to reflect in Mailchimp)
 """
+    else:
+        summaries = update_tags_for_lists(
+            crm_emails=crm_emails,
+            config=config,
+            list_names=list_names,
+            batch_tracker=batch_tracker,
+        )
+        body = _format_list_summaries(summaries)
+
     ui.text_message(
         sender="Workflow",
         recipient="User",
         body=body,
     )
+
+    batch_report = batch_tracker.wait()
+    if batch_report.batches:
+        ui.text_message(
+            sender="Workflow",
+            recipient="User",
+            body=_format_batch_report(batch_report),
+        )
     return "Task Completed"
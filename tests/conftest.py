@@ -1,6 +1,11 @@
+from collections.abc import Iterator
 from typing import Any
 from unittest.mock import MagicMock
 
+import pytest
+
+from mailchimp_api.services.list_cache import list_index_cache
+
 
 class InputMock:
     def __init__(self, responses: list[str]) -> None:
@@ -11,3 +16,10 @@ class InputMock:
     def __call__(self, *args: Any, **kwargs: Any) -> str:
         self.mock(*args, **kwargs)
         return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def clear_list_index_cache() -> Iterator[None]:
+    list_index_cache.clear()
+    yield
+    list_index_cache.clear()
@@ -1,13 +1,21 @@
+import gzip
+import os
 from io import BytesIO
 from pathlib import Path
+from unittest.mock import patch
 
 import pandas as pd
 import pytest
 from _pytest.monkeypatch import MonkeyPatch
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
 from fastapi.testclient import TestClient
 
-from mailchimp_api.deployment.main_1_fastapi import _save_file, app
+from mailchimp_api.deployment.main_1_fastapi import (
+    _remove_abandoned_uploads,
+    _save_file,
+    app,
+)
+from mailchimp_api.upload_sessions import upload_sessions
 
 
 class TestApp:
@@ -28,11 +36,16 @@ class TestApp:
         # Return the temporary directory so it can be used in tests if needed
         return uploaded_files_dir
 
-    def test_save_file(self) -> None:
+    @pytest.mark.asyncio
+    async def test_save_file(self, monkeypatch: MonkeyPatch) -> None:
+        # the header and rows are spread over several chunks
+        monkeypatch.setattr(
+            "mailchimp_api.deployment.main_1_fastapi.UPLOAD_CHUNK_SIZE", 4
+        )
         csv_content = "email\nexample1@example.com\nexample2@example.com"
         csv_file = BytesIO(csv_content.encode("utf-8"))
         uploaded_file = UploadFile(filename="emails.csv", file=csv_file)
-        path = _save_file(uploaded_file, "22-09-2021")
+        path = await _save_file(uploaded_file, "22-09-2021")
         df = pd.read_csv(path)
 
         expected_df = pd.DataFrame(
@@ -40,11 +53,79 @@ class TestApp:
         )
         assert df.equals(expected_df)
 
+    @pytest.mark.asyncio
+    async def test_save_file_rejects_too_large_file(
+        self, patch_uploaded_files_dir: Path
+    ) -> None:
+        csv_file = BytesIO(b"email\nexample1@example.com\n")
+        uploaded_file = UploadFile(filename="emails.csv", file=csv_file)
+
+        with pytest.raises(HTTPException) as e:
+            await _save_file(uploaded_file, "22-09-2021", max_size=10)
+
+        assert e.value.status_code == 413
+        assert list(patch_uploaded_files_dir.iterdir()) == []
+
+    def test_upload_endpoint_rejects_too_large_file(
+        self, patch_uploaded_files_dir: Path, monkeypatch: MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(
+            "mailchimp_api.deployment.main_1_fastapi.MAX_UPLOAD_SIZE", 10
+        )
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.csv", BytesIO(b"email\nexample1@example.com\n"))},
+            data={"session_id": "test-22-09-2021"},
+        )
+
+        assert response.status_code == 413
+        assert "The file is larger than 10 bytes" in response.text
+        assert list(patch_uploaded_files_dir.iterdir()) == []
+
+    def test_upload_endpoint_rejects_too_large_request_before_parsing_form(
+        self, monkeypatch: MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(
+            "mailchimp_api.deployment.main_1_fastapi.MAX_UPLOAD_SIZE", 10
+        )
+        monkeypatch.setattr(
+            "mailchimp_api.deployment.main_1_fastapi.MULTIPART_OVERHEAD_BYTES", 0
+        )
+        with patch(
+            "starlette.requests.Request.form", side_effect=AssertionError("parsed")
+        ):
+            response = self.client.post(
+                "/upload",
+                files={"file": ("emails.csv", BytesIO(b"email\n" * 10))},
+                data={"session_id": "test-22-09-2021"},
+            )
+
+        assert response.status_code == 413
+
+    def test_remove_abandoned_uploads_ignores_removed_files(
+        self, patch_uploaded_files_dir: Path, monkeypatch: MonkeyPatch
+    ) -> None:
+        abandoned = patch_uploaded_files_dir / "uploaded-file-abandoned"
+        abandoned.write_bytes(b"email\n")
+        os.utime(abandoned, (0, 0))
+        recent = patch_uploaded_files_dir / "uploaded-file-recent"
+        recent.write_bytes(b"email\n")
+        # removed by its workflow after it was listed
+        removed = patch_uploaded_files_dir / "uploaded-file-removed"
+        monkeypatch.setattr(
+            Path, "glob", lambda self, pattern: iter([removed, abandoned, recent])
+        )
+
+        _remove_abandoned_uploads()
+
+        assert not abandoned.exists()
+        assert recent.exists()
+
     def test_upload_file_endpoint(self) -> None:
-        timestamp = "22-09-2021"
-        response = self.client.get(f"/upload-file?timestamp={timestamp}")
+        session_id = "5f2b0c1d9e8a4b7c"
+        response = self.client.get(f"/upload-file?session_id={session_id}")
         assert response.status_code == 200
-        assert timestamp in response.text
+        assert session_id in response.text
 
     def test_upload_endpoint(self) -> None:
         csv_content = "email\nemail@gmail.com\n"
@@ -53,16 +134,42 @@ class TestApp:
         response = self.client.post(
             "/upload",
             files={"file": ("emails.csv", csv_file)},
-            data={"timestamp": "test-22-09-2021"},
+            data={"session_id": "test-22-09-2021"},
         )
         assert response.status_code == 200
         expected_msg = "Successfully uploaded emails.csv. Please close the tab and go back to the chat."
         assert expected_msg == response.json()["message"]
 
+    def test_upload_endpoint_hands_file_over_to_session(
+        self, patch_uploaded_files_dir: Path
+    ) -> None:
+        session = upload_sessions.create()
+        csv_file = BytesIO(b"email\nemail@gmail.com\n")
+
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.csv", csv_file, "text/csv")},
+            data={"session_id": session.id},
+        )
+        assert response.status_code == 200
+        assert session.state == "uploaded"
+        assert session.file is not None
+        assert session.file.read() == b"email\nemail@gmail.com\n"
+        assert list(patch_uploaded_files_dir.glob("uploaded-file-*")) == []
+
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.csv", BytesIO(b"email\n"), "text/csv")},
+            data={"session_id": session.id},
+        )
+        assert response.status_code == 409
+
+        upload_sessions.close(session.id)
+
     def test_upload_endpoint_raises_400_error_if_file_isnt_provided(self) -> None:
-        response = self.client.post("/upload", data={"timestamp": "test-22-09-2021"})
+        response = self.client.post("/upload", data={"session_id": "test-22-09-2021"})
         assert response.status_code == 400
-        assert "Please provide .csv file" in response.text
+        assert "Please provide a CRM file" in response.text
 
     def test_upload_endpoint_raises_400_error_if_file_is_not_csv(self) -> None:
         csv_content = "email\n"
@@ -70,10 +177,60 @@ class TestApp:
         response = self.client.post(
             "/upload",
             files={"file": ("emails.txt", csv_file)},
-            data={"timestamp": "test-22-09-2021"},
+            data={"session_id": "test-22-09-2021"},
         )
         assert response.status_code == 400
-        assert "Only CSV files are supported" in response.text
+        assert "Only CSV, gzipped CSV, ZIP and Parquet files are supported" in (
+            response.text
+        )
+
+    def test_upload_endpoint_rejects_parquet_without_pyarrow(
+        self, monkeypatch: MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(
+            "mailchimp_api.processing.crm_file.is_module_available",
+            lambda module_name: False,
+        )
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.parquet", BytesIO(b"PAR1"))},
+            data={"session_id": "test-22-09-2021"},
+        )
+        assert response.status_code == 400
+        assert "Parquet files require the pyarrow package" in response.text
+
+        response = self.client.get("/upload-file?session_id=test-22-09-2021")
+        assert "accept='.csv,.csv.gz,.zip'" in response.text
+
+    def test_upload_endpoint_accepts_gzipped_csv(
+        self, patch_uploaded_files_dir: Path
+    ) -> None:
+        csv_file = BytesIO(gzip.compress(b"email\nemail@gmail.com\n"))
+
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.csv.gz", csv_file)},
+            data={"session_id": "test-22-09-2021"},
+        )
+
+        assert response.status_code == 200
+        path = patch_uploaded_files_dir / "uploaded-file-test-22-09-2021"
+        assert gzip.decompress(path.read_bytes()) == b"email\nemail@gmail.com\n"
+
+    def test_upload_endpoint_validates_header_of_gzipped_csv(
+        self, patch_uploaded_files_dir: Path
+    ) -> None:
+        csv_file = BytesIO(gzip.compress(b"name\nJohn\n"))
+
+        response = self.client.post(
+            "/upload",
+            files={"file": ("emails.csv.gz", csv_file)},
+            data={"session_id": "test-22-09-2021"},
+        )
+
+        assert response.status_code == 400
+        assert "'email' column not found in CSV file" in response.text
+        assert list(patch_uploaded_files_dir.iterdir()) == []
 
     def test_upload_endpoint_raises_400_error_if_email_column_not_found(self) -> None:
         csv_content = "name\n"
@@ -81,7 +238,7 @@ class TestApp:
         response = self.client.post(
             "/upload",
             files={"file": ("emails.csv", csv_file)},
-            data={"timestamp": "test-22-09-2021"},
+            data={"session_id": "test-22-09-2021"},
         )
         assert response.status_code == 400
         assert "'email' column not found in CSV file" in response.text
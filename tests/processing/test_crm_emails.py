@@ -0,0 +1,25 @@
+import pandas as pd
+
+from mailchimp_api.processing.crm_emails import CrmEmailIndex, normalize_emails
+
+
+def test_normalize_emails() -> None:
+    emails = pd.Series([" Email1@Airt.ai", "email2@airt.ai\t", None])
+
+    assert normalize_emails(emails).tolist() == [
+        "email1@airt.ai",
+        "email2@airt.ai",
+        pd.NA,
+    ]
+
+
+def test_crm_email_index_matches_normalized_emails() -> None:
+    crm_emails = CrmEmailIndex(
+        ["email1@airt.ai", " EMAIL1@airt.ai", "email2@airt.ai", "", None]  # type: ignore[list-item]
+    )
+    assert len(crm_emails) == 2
+
+    found = crm_emails.match(pd.Series(["Email1@airt.ai ", "other@airt.ai"]))
+
+    assert found.tolist() == [True, False]
+    assert crm_emails.unmatched_emails == ["email2@airt.ai"]
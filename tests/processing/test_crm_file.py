@@ -0,0 +1,121 @@
+import gzip
+import io
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mailchimp_api.processing import crm_file
+from mailchimp_api.processing.crm_file import (
+    get_crm_file_format,
+    get_crm_file_suffixes,
+    parse_csv_header,
+    read_crm_emails,
+    read_crm_header,
+    validate_csv_header,
+)
+
+CSV_CONTENT = b"name,email\nJohn,John@airt.ai\nJane,jane@airt.ai\n"
+
+
+def test_parse_csv_header() -> None:
+    assert parse_csv_header(b'\xef\xbb\xbfname,"email"\r\nJohn,john@') == [
+        "name",
+        "email",
+    ]
+
+
+def test_validate_csv_header() -> None:
+    validate_csv_header(["name", " email"])
+
+    with pytest.raises(ValueError, match="'email' column not found"):
+        validate_csv_header(["name"])
+
+
+@pytest.mark.parametrize("chunksize", [1, 100])
+def test_read_crm_emails(tmp_path: Path, chunksize: int) -> None:
+    path = tmp_path / "crm.csv"
+    path.write_text(
+        "name,email\n"
+        "John,john@airt.ai\n"
+        "John,John@airt.ai \n"
+        "Jane,\n"
+        "Jane,jane@airt.ai\n"
+    )
+
+    emails = read_crm_emails(path, chunksize=chunksize, engine="c")
+
+    assert emails == {"john@airt.ai", "jane@airt.ai"}
+
+
+def test_read_crm_emails_without_email_column(tmp_path: Path) -> None:
+    path = tmp_path / "crm.csv"
+    path.write_text("name\nJohn\n")
+
+    with pytest.raises(ValueError, match="'email' column not found"):
+        read_crm_emails(path)
+
+
+def test_get_crm_file_format() -> None:
+    assert get_crm_file_format("crm.CSV") == "csv"
+    assert get_crm_file_format("crm.csv.gz") == "csv.gz"
+    assert get_crm_file_format("crm.zip") == "zip"
+
+    with pytest.raises(ValueError, match="Only CSV"):
+        get_crm_file_format("crm.txt")
+
+
+def test_get_crm_file_format_parquet(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(crm_file, "is_module_available", lambda module_name: True)
+    assert get_crm_file_format("crm.parquet") == "parquet"
+    assert get_crm_file_suffixes() == [".csv", ".csv.gz", ".zip", ".parquet"]
+
+    monkeypatch.setattr(crm_file, "is_module_available", lambda module_name: False)
+    with pytest.raises(ValueError, match="Parquet files require the pyarrow package"):
+        get_crm_file_format("crm.parquet")
+    assert get_crm_file_suffixes() == [".csv", ".csv.gz", ".zip"]
+
+
+def _zip(content: bytes, name: str = "crm.csv") -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "content", [CSV_CONTENT, gzip.compress(CSV_CONTENT), _zip(CSV_CONTENT)]
+)
+def test_read_compressed_crm_emails(content: bytes) -> None:
+    file = io.BytesIO(content)
+
+    assert read_crm_header(file) == ["name", "email"]
+    assert read_crm_emails(file, chunksize=1, engine="c") == {
+        "john@airt.ai",
+        "jane@airt.ai",
+    }
+
+
+def test_read_crm_emails_from_zip_without_csv() -> None:
+    with pytest.raises(ValueError, match="exactly one CSV file"):
+        read_crm_emails(io.BytesIO(_zip(CSV_CONTENT, name="crm.txt")))
+
+
+def test_read_parquet_crm_emails(tmp_path: Path) -> None:
+    pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "crm.parquet"
+    pd.DataFrame(
+        {"name": ["John", "Jane"], "email": ["John@airt.ai", None]}
+    ).to_parquet(path)
+
+    assert read_crm_header(path) == ["name", "email"]
+    assert read_crm_emails(path, chunksize=1) == {"john@airt.ai"}
+
+
+def test_read_parquet_crm_emails_with_padded_column_name(tmp_path: Path) -> None:
+    pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "crm.parquet"
+    pd.DataFrame({" email ": ["John@airt.ai"]}).to_parquet(path)
+
+    assert read_crm_emails(path) == {"john@airt.ai"}
@@ -0,0 +1,40 @@
+import numpy as np
+
+from mailchimp_api.processing.member_tags import (
+    NO_TAG,
+    MemberTags,
+    TagVocabulary,
+)
+
+
+def test_member_tags_from_members() -> None:
+    vocabulary = TagVocabulary()
+    member_tags = MemberTags.from_members(
+        [
+            {"id": "a", "tags": [{"name": "M1"}, {"name": "newsletter"}]},
+            {"id": "b", "tags": []},
+            {"id": "c", "tags": [{"name": "M1"}]},
+        ],
+        vocabulary,
+    )
+
+    assert len(member_tags) == 3
+    assert vocabulary.names == ["M1", "newsletter"]
+    assert member_tags.tag_offsets.tolist() == [0, 2, 2, 3]
+    assert member_tags.tag_codes.tolist() == [0, 1, 0]
+    assert member_tags.tag_member_indices.tolist() == [0, 0, 2]
+
+
+def test_lookup_table() -> None:
+    vocabulary = TagVocabulary()
+    for name in ["M2", "newsletter", "M1"]:
+        vocabulary.encode(name)
+
+    table = vocabulary.lookup_table({"M1": "M2", "M2": "M3", "M3": None})
+
+    assert vocabulary.names == ["M2", "newsletter", "M1", "M3"]
+    assert table.tolist() == [3, NO_TAG, 0, NO_TAG]
+    assert vocabulary.decode(np.array([2, 3], dtype=np.int32)).tolist() == [
+        "M1",
+        "M3",
+    ]
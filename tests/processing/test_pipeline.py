@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from mailchimp_api.processing.pipeline import prefetch
+
+
+def test_prefetch_yields_items_in_order() -> None:
+    assert list(prefetch(range(100), maxsize=3)) == list(range(100))
+
+
+def test_prefetch_raises_producer_error() -> None:
+    def items() -> Iterator[int]:
+        yield 1
+        raise RuntimeError("Request failed")
+
+    with pytest.raises(RuntimeError, match="Request failed"):
+        list(prefetch(items(), maxsize=3))
+
+
+def test_prefetch_runs_at_most_maxsize_items_ahead() -> None:
+    produced = []
+
+    def items() -> Iterator[int]:
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    prefetched = prefetch(items(), maxsize=2)
+    assert next(prefetched) == 0
+    time.sleep(0.3)
+
+    # one item consumed, two waiting in the queue and one blocked in put
+    assert len(produced) <= 4
+    prefetched.close()
+
+
+def test_closing_prefetch_stops_producer() -> None:
+    produced = []
+
+    def items() -> Iterator[int]:
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    prefetched = prefetch(items(), maxsize=1)
+    assert next(prefetched) == 0
+    prefetched.close()
+    count = len(produced)
+    time.sleep(0.3)
+
+    assert len(produced) == count < 1000
+
+
+def test_closing_prefetch_closes_items_in_producer_thread(tmp_path: Path) -> None:
+    closed_in = []
+
+    def items() -> Iterator[int]:
+        # SQLite objects may only be used in the thread that created them
+        with closing(sqlite3.connect(tmp_path / "items.sqlite3")) as connection:
+            try:
+                for i in range(10):
+                    connection.execute("SELECT 1")
+                    yield i
+            finally:
+                closed_in.append(threading.current_thread())
+
+    prefetched = prefetch(items(), maxsize=2)
+    assert next(prefetched) == 0
+    prefetched.close()
+
+    assert len(closed_in) == 1
+    assert closed_in[0] is not threading.current_thread()
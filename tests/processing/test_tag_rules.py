@@ -0,0 +1,121 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from mailchimp_api.processing.member_tags import MemberTags, TagVocabulary
+from mailchimp_api.processing.tag_rules import (
+    DEFAULT_TAG_RULES,
+    TagTransitionRule,
+    TagTransitionRules,
+)
+
+
+def _plan(
+    tag_rules: TagTransitionRules, members: list[dict[str, object]]
+) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    vocabulary = TagVocabulary()
+    member_tags = MemberTags.from_members(members, vocabulary)  # type: ignore[arg-type]
+    return tag_rules.plan(member_tags, vocabulary)
+
+
+def test_from_chains() -> None:
+    tag_rules = TagTransitionRules.from_chains(
+        [["M1", "M2", "M3"], ["W1", "W2"]], terminal_tags=["unsubscribed"]
+    )
+
+    assert tag_rules.next_tag_map == {
+        "M1": "M2",
+        "M2": "M3",
+        "M3": None,
+        "W1": "W2",
+        "W2": None,
+        "unsubscribed": None,
+    }
+    assert tag_rules.rules["M2"].priority == 1
+    assert tag_rules.rules["unsubscribed"].terminal
+
+
+def test_duplicate_rules() -> None:
+    with pytest.raises(ValueError, match="Tag M1 has more than one transition rule"):
+        TagTransitionRules.from_chains([["M1", "M2"], ["M1", "W1"]])
+
+
+def test_plan_default_rules() -> None:
+    add_tag_members, remove_tag_members = _plan(
+        DEFAULT_TAG_RULES,
+        [
+            {"id": "a", "tags": [{"name": "M2"}, {"name": "newsletter"}]},
+            {"id": "b", "tags": [{"name": "M1"}]},
+            {"id": "c", "tags": [{"name": "M3"}, {"name": "M1"}]},
+            {"id": "d", "tags": [{"name": "M1"}, {"name": "M2"}]},
+        ],
+    )
+
+    # c is kept at the terminal M3, d moves only from M2
+    assert add_tag_members == {"M3": ["a", "d"], "M2": ["b"]}
+    assert remove_tag_members == {"M2": ["a", "d"], "M1": ["b"]}
+
+
+def test_plan_priorities() -> None:
+    tag_rules = TagTransitionRules(
+        [
+            TagTransitionRule("M1", "M2", priority=1),
+            TagTransitionRule("W1", "W2", priority=1),
+            TagTransitionRule("vip", "vip-welcome", priority=5),
+        ]
+    )
+
+    add_tag_members, remove_tag_members = _plan(
+        tag_rules,
+        [
+            {"id": "a", "tags": [{"name": "M1"}, {"name": "vip"}]},
+            # the first tag wins on equal priorities
+            {"id": "b", "tags": [{"name": "W1"}, {"name": "M1"}]},
+        ],
+    )
+
+    assert add_tag_members == {"vip-welcome": ["a"], "W2": ["b"]}
+    assert remove_tag_members == {"vip": ["a"], "W1": ["b"]}
+
+
+def test_plan_without_transitions() -> None:
+    assert _plan(DEFAULT_TAG_RULES, [{"id": "a", "tags": []}]) == ({}, {})
+    assert _plan(DEFAULT_TAG_RULES, [{"id": "a", "tags": [{"name": "x"}]}]) == (
+        {},
+        {},
+    )
+
+
+def test_load(tmp_path: Path) -> None:
+    path = tmp_path / "tag_rules.json"
+    path.write_text(
+        json.dumps(
+            {
+                "chains": [["W1", "W2", "W3"]],
+                "terminal_tags": ["unsubscribed"],
+                "priorities": {"W1": 10},
+                "rules": [{"tag": "trial", "next_tag": "customer", "priority": 3}],
+                "dated_tag_template": "{tag} ({date:%Y-%m-%d})",
+            }
+        )
+    )
+
+    tag_rules = TagTransitionRules.load(path)
+
+    assert tag_rules.next_tag_map == {
+        "W1": "W2",
+        "W2": "W3",
+        "W3": None,
+        "unsubscribed": None,
+        "trial": "customer",
+    }
+    assert tag_rules.rules["W1"].priority == 10
+    assert tag_rules.dated_tag("W2", datetime(2024, 3, 1)) == "W2 (2024-03-01)"
+
+
+def test_dated_tag() -> None:
+    assert DEFAULT_TAG_RULES.dated_tag("M2", datetime(2024, 3, 1)) == "M2 - 01.03.2024."
+    tag_rules = TagTransitionRules.from_chains([["M1", "M2"]], dated_tag_template=None)
+    assert tag_rules.dated_tag("M2", datetime(2024, 3, 1)) is None
@@ -1,18 +1,26 @@
 import os
 from datetime import datetime
+from pathlib import Path
 from typing import Any
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pandas as pd
 import pytest
 
 from mailchimp_api.config import Config
+from mailchimp_api.processing.crm_emails import CrmEmailIndex
 from mailchimp_api.processing.update_tags import (
-    _batch_update_tags,
     _create_add_and_remove_tags_dicts,
+    _should_look_up_members,
+    _update_list_tags,
     update_tags,
+    update_tags_async,
+    update_tags_for_lists,
+)
+from mailchimp_api.services.mailchimp_service import (
+    MailchimpService,
+    get_subscriber_hash,
 )
-from mailchimp_api.services.mailchimp_service import MailchimpService
 
 
 class TestUpdateTags:
@@ -76,50 +84,108 @@ class TestUpdateTags:
             "M2": ["third_member_id"],
         }
 
+    def test_create_add_and_remove_tags_dicts_keeps_member_order(self) -> None:
+        members_with_tags_df = pd.DataFrame(
+            {
+                "id": ["a", "b", "c", "d"],
+                "email": ["a@airt.ai", "b@airt.ai", "c@airt.ai", "d@airt.ai"],
+                "tags": [
+                    [{"id": 1, "name": "M2"}],
+                    [],
+                    [{"id": 2, "name": "M1"}, {"id": 1, "name": "M2"}],
+                    [{"id": 2, "name": "M1"}],
+                ],
+            }
+        )
+
+        add_tag_members, remove_tag_members = _create_add_and_remove_tags_dicts(
+            members_with_tags_df=members_with_tags_df,
+        )
+
+        # c moves only from M2, the furthest of its tags
+        assert list(add_tag_members.items()) == [("M3", ["a", "c"]), ("M2", ["d"])]
+        assert list(remove_tag_members.items()) == [("M2", ["a", "c"]), ("M1", ["d"])]
+
+    def test_create_add_and_remove_tags_dicts_without_members(self) -> None:
+        add_tag_members, remove_tag_members = _create_add_and_remove_tags_dicts(
+            members_with_tags_df=pd.DataFrame(columns=["id", "email", "tags"]),
+        )
+
+        assert add_tag_members == {}
+        assert remove_tag_members == {}
+
     @patch("mailchimp_api.processing.update_tags.datetime")
-    @patch("mailchimp_api.services.mailchimp_service.requests.post")
-    def test_batch_update_tags(
-        self, mock_post: MagicMock, mock_datetime: MagicMock
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_list_tags(
+        self, mock_get: MagicMock, mock_post: MagicMock, mock_datetime: MagicMock
     ) -> None:
-        tag_members = {
-            "M2": ["third_member_id"],
-            "M3": ["third_member_id"],
-        }
+        members = [
+            {
+                "id": "first_member_id",
+                "email_address": "email1@airt.ai",
+                "tags": [{"name": "M1"}],
+            },
+            {
+                "id": "second_member_id",
+                "email_address": "email2@airt.ai",
+                "tags": [{"name": "M2"}],
+            },
+        ]
+        page = {"members": members, "total_items": len(members)}
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: page)
         mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
         mock_datetime.now.return_value = datetime(2024, 11, 15, 10, 44, 16, 794923)
+        batch_tracker = MagicMock()
 
-        _batch_update_tags(
+        summary = _update_list_tags(
             mailchimp_service=self.mailchimp_service,
             list_id="list_id",
-            tag_members=tag_members,
-            status="active",
-        )
-
-        assert mock_post.call_count == 4
-        for tag in ["M2", "M2 - 15.11.2024.", "M3", "M3 - 15.11.2024."]:
-            mock_post.assert_any_call(
-                f"{self.config.base_url}/batches",
-                headers=self.config.headers,
-                json={
-                    "operations": [
-                        {
-                            "method": "POST",
-                            "path": "/lists/list_id/members/third_member_id/tags",
-                            "body": f'{{"tags": [{{"name": "{tag}", "status": "active"}}]}}',
-                        }
-                    ]
-                },
-                timeout=10,
-            )
+            list_name="airt",
+            crm_emails=CrmEmailIndex(["email1@airt.ai", "email2@airt.ai"]),
+            batch_tracker=batch_tracker,
+        )
+
+        assert summary.add_tag_members == {
+            "M2": ["first_member_id"],
+            "M3": ["second_member_id"],
+        }
+        assert summary.remove_tag_members == {
+            "M1": ["first_member_id"],
+            "M2": ["second_member_id"],
+        }
+        assert summary.operations == 2
+        assert summary.batch_requests == 1
+        batch_tracker.track.assert_called_once_with(["batch_id"])
+        mock_post.assert_called_once_with(
+            f"{self.config.base_url}/batches",
+            json={
+                "operations": [
+                    {
+                        "method": "POST",
+                        "path": "/lists/list_id/members/first_member_id/tags",
+                        "body": '{"tags": [{"name": "M2", "status": "active"}, {"name": "M2 - 15.11.2024.", "status": "active"}, {"name": "M1", "status": "inactive"}]}',
+                    },
+                    {
+                        "method": "POST",
+                        "path": "/lists/list_id/members/second_member_id/tags",
+                        "body": '{"tags": [{"name": "M3", "status": "active"}, {"name": "M3 - 15.11.2024.", "status": "active"}, {"name": "M2", "status": "inactive"}]}',
+                    },
+                ]
+            },
+            timeout=self.config.timeout,
+        )
 
     @patch("mailchimp_api.processing.update_tags.datetime")
-    @patch("mailchimp_api.services.mailchimp_service.requests.post")
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_update_tags(
         self, mock_get: MagicMock, mock_post: MagicMock, mock_datetime: MagicMock
     ) -> None:
         json_responses = [
             {"lists": [{"id": "list_id", "name": "airt"}]},
+            {"total_items": 3},
             {
                 "members": [
                     {
@@ -147,14 +213,15 @@ class TestUpdateTags:
                             {"id": 2, "name": "M2"},
                         ],
                     },
-                ]
+                ],
+                "total_items": 3,
             },
         ]
         crm_df = pd.DataFrame(
             {
                 "email": [
                     "email1@airt.ai",
-                    "email2@airt.ai",
+                    " Email2@airt.ai",
                 ]
             }
         )
@@ -163,38 +230,33 @@ class TestUpdateTags:
         mock_post.return_value.json.return_value = {"id": "batch_id"}
         mock_datetime.now.return_value = datetime(2024, 11, 15, 10, 44, 16, 794923)
         add_tag_members, remove_tag_members = update_tags(
-            crm_df=crm_df, config=self.config, list_name="airt"
+            crm_emails=crm_df["email"], config=self.config, list_name="airt"
         )
 
-        assert mock_get.call_count == 2
+        assert mock_get.call_count == 3
         for url in [
-            f"{self.config.base_url}/lists?fields=lists.id,lists.name",
-            f"{self.config.base_url}/lists/list_id/members?fields=members.id,members.email_address,members.tags",
+            f"{self.config.base_url}/lists?fields=lists.id,lists.name,total_items&count=1000&offset=0",
+            f"{self.config.base_url}/lists/list_id/members?fields=total_items&count=1",
+            f"{self.config.base_url}/lists/list_id/members?fields=members.id,members.email_address,members.tags.name,total_items&count=1000&offset=0",
         ]:
             mock_get.assert_any_call(
                 url,
-                headers=self.config.headers,
-                timeout=10,
+                timeout=self.config.timeout,
             )
 
-        assert mock_post.call_count == 3
-        for status, tag in zip(
-            ["active", "active", "inactive"], ["M3", "M3 - 15.11.2024.", "M2"]
-        ):
-            mock_post.assert_any_call(
-                f"{self.config.base_url}/batches",
-                headers=self.config.headers,
-                json={
-                    "operations": [
-                        {
-                            "method": "POST",
-                            "path": "/lists/list_id/members/third_member_id/tags",
-                            "body": f'{{"tags": [{{"name": "{tag}", "status": "{status}"}}]}}',
-                        }
-                    ]
-                },
-                timeout=10,
-            )
+        mock_post.assert_called_once_with(
+            f"{self.config.base_url}/batches",
+            json={
+                "operations": [
+                    {
+                        "method": "POST",
+                        "path": "/lists/list_id/members/third_member_id/tags",
+                        "body": '{"tags": [{"name": "M3", "status": "active"}, {"name": "M3 - 15.11.2024.", "status": "active"}, {"name": "M2", "status": "inactive"}]}',
+                    }
+                ]
+            },
+            timeout=self.config.timeout,
+        )
         assert add_tag_members == {
             "M3": ["third_member_id"],
         }
@@ -202,6 +264,350 @@ class TestUpdateTags:
             "M2": ["third_member_id"],
         }
 
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_tags_looks_up_few_crm_members(
+        self, mock_get: MagicMock, mock_post: MagicMock
+    ) -> None:
+        member = {
+            "id": "first_member_id",
+            "email_address": "email1@airt.ai",
+            "tags": [{"id": 1, "name": "M1"}],
+        }
+        self.config = Config(dc="us14", api_key="anystring", max_concurrent_requests=1)
+        self._setup_mailchimp_request_method(
+            mock_get,
+            json_responses=[
+                {"lists": [{"id": "list_id", "name": "airt"}]},
+                # two members pages, as many requests as looking up both emails
+                {"total_items": 2000},
+                member,
+            ],
+        )
+        not_found = MagicMock(status_code=404)
+        mock_get.side_effect = [*mock_get.side_effect, not_found]
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
+        crm_df = pd.DataFrame({"email": ["Email1@airt.ai", "unknown@airt.ai"]})
+
+        add_tag_members, _ = update_tags(
+            crm_emails=crm_df["email"], config=self.config, list_name="airt"
+        )
+
+        assert mock_get.call_count == 4
+        mock_get.assert_any_call(
+            f"{self.config.base_url}/lists/list_id/members/{get_subscriber_hash('email1@airt.ai')}?fields=id,email_address,tags.name",
+            timeout=self.config.timeout,
+        )
+        assert add_tag_members == {"M2": ["first_member_id"]}
+
+    @pytest.mark.parametrize(
+        ("crm_email_count", "member_count", "expected"),
+        [
+            (250, 250_000, True),
+            (251, 250_000, False),
+            (1, 1, True),
+            (2, 1, False),
+            (1, 0, False),
+        ],
+    )
+    def test_should_look_up_members(
+        self, crm_email_count: int, member_count: int, expected: bool
+    ) -> None:
+        crm_emails = CrmEmailIndex(f"email{i}@airt.ai" for i in range(crm_email_count))
+
+        with patch.object(
+            self.mailchimp_service, "get_member_count", return_value=member_count
+        ):
+            assert (
+                _should_look_up_members(self.mailchimp_service, "list_id", crm_emails)
+                == expected
+            )
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_tags_combines_pages(
+        self, mock_get: MagicMock, mock_post: MagicMock
+    ) -> None:
+        self.config = Config(
+            dc="us14",
+            api_key="anystring",
+            members_page_size=1,
+            max_concurrent_requests=1,
+            member_lookup_factor=0,
+        )
+        members = [
+            {"id": "a", "email_address": "a@airt.ai", "tags": [{"name": "M1"}]},
+            {"id": "b", "email_address": "b@airt.ai", "tags": [{"name": "M2"}]},
+            {"id": "c", "email_address": "c@airt.ai", "tags": [{"name": "M1"}]},
+        ]
+        self._setup_mailchimp_request_method(
+            mock_get,
+            json_responses=[
+                {"lists": [{"id": "list_id", "name": "airt"}]},
+                *[{"members": [member], "total_items": 3} for member in members],
+            ],
+        )
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
+
+        add_tag_members, remove_tag_members = update_tags(
+            crm_emails=["a@airt.ai", "b@airt.ai", "c@airt.ai"],
+            config=self.config,
+            list_name="airt",
+        )
+
+        assert add_tag_members == {"M2": ["a", "c"], "M3": ["b"]}
+        assert remove_tag_members == {"M1": ["a", "c"], "M2": ["b"]}
+        mock_post.assert_called_once()
+        operations = mock_post.call_args.kwargs["json"]["operations"]
+        assert [operation["path"] for operation in operations] == [
+            "/lists/list_id/members/a/tags",
+            "/lists/list_id/members/b/tags",
+            "/lists/list_id/members/c/tags",
+        ]
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_tags_for_lists(
+        self, mock_get: MagicMock, mock_post: MagicMock
+    ) -> None:
+        self.config = Config(dc="us14", api_key="anystring", member_lookup_factor=0)
+        members = {
+            "first_list_id": [
+                {"id": "a", "email_address": "email1@airt.ai", "tags": [{"name": "M1"}]}
+            ],
+            "second_list_id": [
+                {
+                    "id": "b",
+                    "email_address": "email1@airt.ai",
+                    "tags": [{"name": "M2"}],
+                },
+                {
+                    "id": "c",
+                    "email_address": "email2@airt.ai",
+                    "tags": [{"name": "M1"}],
+                },
+            ],
+        }
+
+        def get(url: str, **kwargs: Any) -> MagicMock:
+            if "/lists?" in url:
+                page: dict[str, Any] = {
+                    "lists": [
+                        {"id": "first_list_id", "name": "first"},
+                        {"id": "second_list_id", "name": "second"},
+                    ]
+                }
+            else:
+                list_id = url.split("/lists/")[1].split("/")[0]
+                page = {
+                    "members": members[list_id],
+                    "total_items": len(members[list_id]),
+                }
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
+
+        summaries = update_tags_for_lists(
+            crm_emails=["email1@airt.ai"],
+            config=self.config,
+            list_names=["first", "second", "missing"],
+        )
+
+        assert [summary.list_name for summary in summaries] == [
+            "first",
+            "second",
+            "missing",
+        ]
+        assert summaries[0].add_tag_members == {"M2": ["a"]}
+        assert summaries[1].add_tag_members == {"M3": ["b"]}
+        assert summaries[2].error == "List missing not found in account lists."
+        assert mock_post.call_count == 2
+
+        summaries = update_tags_for_lists(
+            crm_emails=["email2@airt.ai"], config=self.config, list_names="all"
+        )
+        assert [summary.add_tag_members for summary in summaries] == [
+            {},
+            {"M2": ["c"]},
+        ]
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_tags_writes_submitted_tags_to_snapshot(
+        self, mock_get: MagicMock, mock_post: MagicMock, tmp_path: Path
+    ) -> None:
+        self.config = Config(dc="us14", api_key="anystring", snapshot_dir=tmp_path)
+        members = [
+            {"id": "a", "email_address": "email1@airt.ai", "tags": [{"name": "M1"}]}
+        ]
+
+        def get(url: str, **kwargs: Any) -> MagicMock:
+            if "/lists?" in url:
+                page: dict[str, Any] = {"lists": [{"id": "list_id", "name": "airt"}]}
+            elif "since_last_changed" in url:
+                # Mailchimp doesn't report the tag change as a member change
+                page = {"members": [], "total_items": 0}
+            else:
+                page = {"members": members, "total_items": len(members)}
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
+
+        add_tag_members, _ = update_tags(
+            crm_emails=["email1@airt.ai"], config=self.config, list_name="airt"
+        )
+        assert add_tag_members == {"M2": ["a"]}
+
+        add_tag_members, remove_tag_members = update_tags(
+            crm_emails=["email1@airt.ai"], config=self.config, list_name="airt"
+        )
+        assert add_tag_members == {"M3": ["a"]}
+        assert remove_tag_members == {"M2": ["a"]}
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_update_tags_for_lists_dry_run(
+        self, mock_get: MagicMock, mock_post: MagicMock
+    ) -> None:
+        self.config = Config(
+            dc="us14",
+            api_key="anystring",
+            member_lookup_factor=0,
+            batch_max_operations=2,
+        )
+        members = [
+            {"id": "a", "email_address": "email1@airt.ai", "tags": [{"name": "M1"}]},
+            {"id": "b", "email_address": "email2@airt.ai", "tags": [{"name": "M2"}]},
+            {"id": "c", "email_address": "email3@airt.ai", "tags": [{"name": "M1"}]},
+        ]
+
+        def get(url: str, **kwargs: Any) -> MagicMock:
+            if "/lists?" in url:
+                page: dict[str, Any] = {"lists": [{"id": "list_id", "name": "airt"}]}
+            else:
+                page = {"members": members, "total_items": len(members)}
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get
+
+        (summary,) = update_tags_for_lists(
+            crm_emails=["email1@airt.ai", "email2@airt.ai", "email3@airt.ai"],
+            config=self.config,
+            list_names=["airt"],
+            dry_run=True,
+        )
+
+        mock_post.assert_not_called()
+        assert summary.add_tag_members == {"M2": ["a", "c"], "M3": ["b"]}
+        assert summary.remove_tag_members == {"M1": ["a", "c"], "M2": ["b"]}
+        assert summary.operations == 3
+        assert summary.batch_requests == 2
+
+    @pytest.mark.asyncio
+    @patch("mailchimp_api.processing.update_tags.datetime")
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.post",
+        new_callable=AsyncMock,
+    )
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        new_callable=AsyncMock,
+    )
+    async def test_update_tags_async(
+        self, mock_get: AsyncMock, mock_post: AsyncMock, mock_datetime: MagicMock
+    ) -> None:
+        json_responses = [
+            {"lists": [{"id": "list_id", "name": "airt"}]},
+            {
+                "members": [
+                    {
+                        "id": "first_member_id",
+                        "email_address": "email1@airt.ai",
+                        "tags": [{"id": 1, "name": "M1"}],
+                    },
+                    {
+                        "id": "second_member_id",
+                        "email_address": "email2@gmail.com",
+                        "tags": [{"id": 1, "name": "M1"}],
+                    },
+                ],
+                "total_items": 2,
+            },
+        ]
+        self._setup_mailchimp_request_method(mock_get, json_responses=json_responses)
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_datetime.now.return_value = datetime(2024, 11, 15, 10, 44, 16, 794923)
+        crm_df = pd.DataFrame({"email": ["email1@airt.ai"]})
+
+        add_tag_members, remove_tag_members = await update_tags_async(
+            crm_emails=crm_df["email"], config=self.config, list_name="airt"
+        )
+
+        assert mock_get.await_count == 2
+        mock_post.assert_awaited_once()
+        assert len(mock_post.call_args.kwargs["json"]["operations"]) == 1
+        assert add_tag_members == {"M2": ["first_member_id"]}
+        assert remove_tag_members == {"M1": ["first_member_id"]}
+
+    @pytest.mark.asyncio
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.post",
+        new_callable=AsyncMock,
+    )
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        new_callable=AsyncMock,
+    )
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    async def test_update_tags_async_writes_submitted_tags_to_snapshot(
+        self,
+        mock_get: MagicMock,
+        mock_post: MagicMock,
+        mock_async_get: AsyncMock,
+        mock_async_post: AsyncMock,
+        tmp_path: Path,
+    ) -> None:
+        self.config = Config(dc="us14", api_key="anystring", snapshot_dir=tmp_path)
+        members = [
+            {"id": "a", "email_address": "email1@airt.ai", "tags": [{"name": "M1"}]}
+        ]
+
+        def get(url: str, **kwargs: Any) -> MagicMock:
+            if "/lists?" in url:
+                page: dict[str, Any] = {"lists": [{"id": "list_id", "name": "airt"}]}
+            elif "since_last_changed" in url:
+                # Mailchimp doesn't report the tag change as a member change
+                page = {"members": [], "total_items": 0}
+            else:
+                page = {"members": members, "total_items": len(members)}
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get
+        mock_async_get.side_effect = get
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"id": "batch_id"}
+        mock_async_post.return_value = MagicMock(status_code=200)
+        mock_async_post.return_value.json.return_value = {"id": "batch_id"}
+        crm_emails = ["email1@airt.ai"]
+
+        # the snapshot is created by a synchronous run
+        add_tag_members, _ = update_tags(crm_emails, self.config, "airt")
+        assert add_tag_members == {"M2": ["a"]}
+
+        members[0]["tags"] = [{"name": "M2"}]
+        add_tag_members, _ = await update_tags_async(crm_emails, self.config, "airt")
+        assert add_tag_members == {"M3": ["a"]}
+
+        add_tag_members, _ = update_tags(crm_emails, self.config, "airt")
+        assert add_tag_members == {}
+
     @pytest.mark.skip(reason="real api call")
     def test_real_update_tags(self) -> None:
         crm_df = pd.DataFrame(
@@ -213,4 +619,4 @@ class TestUpdateTags:
             }
         )
         self.config = Config(dc="us14", api_key=os.getenv("MAILCHIMP_API_KEY"))  # type: ignore[arg-type]
-        update_tags(crm_df=crm_df, config=self.config, list_name="airt")
+        update_tags(crm_emails=crm_df["email"], config=self.config, list_name="airt")
@@ -0,0 +1,169 @@
+import asyncio
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from mailchimp_api.config import Config
+from mailchimp_api.services.async_mailchimp_service import AsyncMailchimpService
+
+
+def _response(json_response: dict[str, Any], status_code: int = 200) -> MagicMock:
+    mock_response = MagicMock()
+    mock_response.status_code = status_code
+    mock_response.json.return_value = json_response
+    return mock_response
+
+
+class TestAsyncMailchimpService:
+    @pytest.fixture(autouse=True)
+    def _setup(self) -> None:
+        self.config = Config(dc="us14", api_key="anystring", members_page_size=2)
+        self.mailchimp_service = AsyncMailchimpService(config=self.config)
+        return
+
+    def test_client_is_configured(self) -> None:
+        client = self.mailchimp_service.client
+
+        assert client.headers["Authorization"] == "Bearer anystring"
+        assert client.timeout.connect == self.config.timeout[0]
+        assert client.timeout.read == self.config.timeout[1]
+
+    @pytest.mark.asyncio
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        new_callable=AsyncMock,
+    )
+    async def test_get_account_lists(self, mock_get: AsyncMock) -> None:
+        mock_get.return_value = _response({"lists": []})
+
+        async with self.mailchimp_service as mailchimp_service:
+            account_lists = await mailchimp_service.get_account_lists()
+
+        assert account_lists == {"lists": []}
+        mock_get.assert_awaited_once_with(
+            f"{self.config.base_url}/lists?fields=lists.id,lists.name,total_items&count=1000&offset=0"
+        )
+
+    @pytest.mark.asyncio
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        new_callable=AsyncMock,
+    )
+    async def test_get_account_lists_reads_all_pages(self, mock_get: AsyncMock) -> None:
+        account_lists = [{"id": str(i), "name": f"list {i}"} for i in range(1500)]
+
+        async def get_page(url: str) -> MagicMock:
+            offset = int(parse_qs(urlparse(url).query)["offset"][0])
+            return _response(
+                {
+                    "lists": account_lists[offset : offset + 1000],
+                    "total_items": len(account_lists),
+                }
+            )
+
+        mock_get.side_effect = get_page
+
+        async with self.mailchimp_service as mailchimp_service:
+            assert await mailchimp_service.get_account_lists() == {
+                "lists": account_lists
+            }
+
+        assert mock_get.await_count == 2
+
+    @pytest.mark.asyncio
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        new_callable=AsyncMock,
+    )
+    async def test_iter_members_with_tags(self, mock_get: AsyncMock) -> None:
+        members = [{"id": str(i)} for i in range(5)]
+
+        async def get_page(url: str) -> MagicMock:
+            offset = int(parse_qs(urlparse(url).query)["offset"][0])
+            return _response(
+                {"members": members[offset : offset + 2], "total_items": 5}
+            )
+
+        mock_get.side_effect = get_page
+
+        members_pages = [
+            page async for page in self.mailchimp_service.iter_members_with_tags("123")
+        ]
+
+        assert members_pages == [members[0:2], members[2:4], members[4:5]]
+        assert mock_get.await_count == 3
+
+    @pytest.mark.asyncio
+    @patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.post",
+        new_callable=AsyncMock,
+    )
+    async def test_post_batch_update_members_tag(self, mock_post: AsyncMock) -> None:
+        self.mailchimp_service.config = Config(
+            dc="us14", api_key="anystring", batch_max_operations=200
+        )
+        mock_post.return_value = _response({"id": "batch_id"})
+        member_ids = [str(i) for i in range(500)]
+
+        await self.mailchimp_service.post_batch_update_members_tag(
+            list_id="123",
+            member_ids=member_ids,
+            tag_name="tag1",
+        )
+
+        assert mock_post.await_count == 3
+        for i in range(0, 500, 200):
+            mock_post.assert_any_await(
+                f"{self.config.base_url}/batches",
+                json={
+                    "operations": [
+                        {
+                            "method": "POST",
+                            "path": f"/lists/123/members/{member_id}/tags",
+                            "body": '{"tags": [{"name": "tag1", "status": "active"}]}',
+                        }
+                        for member_id in member_ids[i : i + 200]
+                    ]
+                },
+            )
+
+
+@pytest.mark.asyncio
+async def test_services_share_in_flight_budget_of_api_key() -> None:
+    # the limits are only used by the first service of the key
+    config = Config(
+        dc="us14",
+        api_key="in-flight-key",
+        max_concurrent_requests=2,
+        requests_per_second=1000,
+    )
+    in_flight = 0
+    max_in_flight = 0
+
+    async def get(url: str) -> MagicMock:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _response({"lists": []})
+
+    with patch(
+        "mailchimp_api.services.async_mailchimp_service.httpx.AsyncClient.get",
+        side_effect=get,
+    ):
+        async with (
+            AsyncMailchimpService(config) as first_service,
+            AsyncMailchimpService(config) as second_service,
+        ):
+            await asyncio.gather(
+                *(
+                    service._mailchimp_request_get(f"{config.base_url}/lists")
+                    for _ in range(5)
+                    for service in (first_service, second_service)
+                )
+            )
+
+    assert max_in_flight == 2
@@ -0,0 +1,155 @@
+import tarfile
+from datetime import datetime, timezone
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from mailchimp_api.config import Config
+from mailchimp_api.services.batch_tracker import BatchReport, BatchResult, BatchTracker
+
+
+def _batch(batch_id: str, status: str, **kwargs: Any) -> dict[str, Any]:
+    return {"id": batch_id, "status": status, **kwargs}
+
+
+class TestBatchTracker:
+    @pytest.fixture(autouse=True)
+    def _setup(self) -> None:
+        self.config = Config(
+            dc="us14",
+            api_key="anystring",
+            batch_poll_interval=0.01,
+            batch_max_poll_interval=0.01,
+            batch_wait_timeout=1,
+        )
+        self.batch_tracker = BatchTracker(config=self.config)
+        return
+
+    @patch("mailchimp_api.services.mailchimp_service.MailchimpService.get_batch")
+    def test_wait_without_batches(self, mock_get_batch: MagicMock) -> None:
+        batch_report = self.batch_tracker.wait()
+
+        assert batch_report.batches == []
+        mock_get_batch.assert_not_called()
+
+    @patch("mailchimp_api.services.mailchimp_service.MailchimpService.get_batch")
+    def test_wait_polls_until_batches_are_finished(
+        self, mock_get_batch: MagicMock
+    ) -> None:
+        statuses = {
+            "batch-1": iter(["pending", "started", "finished"]),
+            "batch-2": iter(["finished"]),
+        }
+        mock_get_batch.side_effect = lambda batch_id: _batch(
+            batch_id,
+            next(statuses[batch_id]),
+            total_operations=10,
+            finished_operations=10,
+            submitted_at="2024-11-15T10:44:00+00:00",
+            completed_at="2024-11-15T10:44:05+00:00",
+        )
+
+        self.batch_tracker.track(["batch-1", "batch-2"])
+        batch_report = self.batch_tracker.wait()
+
+        assert [batch.id for batch in batch_report.batches] == ["batch-1", "batch-2"]
+        assert mock_get_batch.call_count == 4
+        assert batch_report.unfinished_batches == []
+        assert batch_report.finished_operations == 20
+        assert batch_report.duration == 5
+        assert batch_report.operations_per_second == 4
+
+    @patch("mailchimp_api.services.mailchimp_service.MailchimpService.get_batch")
+    def test_wait_reports_unfinished_batches_after_timeout(
+        self, mock_get_batch: MagicMock
+    ) -> None:
+        self.config.batch_wait_timeout = 0.05
+        mock_get_batch.return_value = _batch("batch-1", "started")
+
+        self.batch_tracker.track(["batch-1"])
+        batch_report = self.batch_tracker.wait()
+
+        assert batch_report.unfinished_batches == [
+            BatchResult(id="batch-1", status="started")
+        ]
+        assert batch_report.operations_per_second is None
+
+    @patch(
+        "mailchimp_api.services.mailchimp_service.MailchimpService.iter_batch_results"
+    )
+    @patch("mailchimp_api.services.mailchimp_service.MailchimpService.get_batch")
+    def test_wait_collects_errored_operations(
+        self, mock_get_batch: MagicMock, mock_iter_batch_results: MagicMock
+    ) -> None:
+        mock_get_batch.return_value = _batch(
+            "batch-1",
+            "finished",
+            total_operations=3,
+            finished_operations=3,
+            errored_operations=1,
+            response_body_url="https://example.com/results.tar.gz",
+        )
+        error = {"status_code": 404, "operation_id": None, "response": "{}"}
+        mock_iter_batch_results.return_value = iter(
+            [{"status_code": 200}, error, {"status_code": 200}]
+        )
+
+        self.batch_tracker.track(["batch-1"])
+        batch_report = self.batch_tracker.wait()
+
+        mock_iter_batch_results.assert_called_once_with(
+            "https://example.com/results.tar.gz"
+        )
+        assert batch_report.errored_operations == 1
+        assert batch_report.batches[0].errors == [error]
+
+    @patch(
+        "mailchimp_api.services.mailchimp_service.MailchimpService.iter_batch_results"
+    )
+    @patch("mailchimp_api.services.mailchimp_service.MailchimpService.get_batch")
+    def test_wait_reports_unreadable_results(
+        self, mock_get_batch: MagicMock, mock_iter_batch_results: MagicMock
+    ) -> None:
+        mock_get_batch.return_value = _batch(
+            "batch-1",
+            "finished",
+            total_operations=3,
+            finished_operations=3,
+            errored_operations=1,
+            response_body_url="https://example.com/results.tar.gz",
+        )
+        mock_iter_batch_results.side_effect = tarfile.ReadError("not a gzip file")
+
+        self.batch_tracker.track(["batch-1"])
+        batch_report = self.batch_tracker.wait()
+
+        assert batch_report.finished_operations == 3
+        assert batch_report.errored_operations == 1
+        assert batch_report.batches[0].errors == [
+            {"error": "ReadError('not a gzip file')"}
+        ]
+
+
+def test_batch_report_duration() -> None:
+    batch_report = BatchReport(
+        [
+            BatchResult(
+                id="batch-1",
+                status="finished",
+                finished_operations=100,
+                submitted_at=datetime(2024, 11, 15, 10, 0, 0, tzinfo=timezone.utc),
+                completed_at=datetime(2024, 11, 15, 10, 0, 20, tzinfo=timezone.utc),
+            ),
+            BatchResult(
+                id="batch-2",
+                status="finished",
+                finished_operations=100,
+                submitted_at=datetime(2024, 11, 15, 10, 0, 10, tzinfo=timezone.utc),
+                completed_at=datetime(2024, 11, 15, 10, 0, 40, tzinfo=timezone.utc),
+            ),
+        ]
+    )
+
+    assert batch_report.duration == 40
+    assert batch_report.operations_per_second == 5
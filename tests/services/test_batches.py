@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from mailchimp_api.services.batches import (
+    create_member_tags_operations,
+    create_tag_operations,
+    pack_operations,
+)
+
+
+def _payload_bytes(operations: list[dict[str, str]]) -> int:
+    return len(json.dumps({"operations": operations}))
+
+
+def test_create_member_tags_operations() -> None:
+    operations = create_member_tags_operations(
+        "123",
+        {
+            "456": [
+                {"name": "M2", "status": "active"},
+                {"name": "M1", "status": "inactive"},
+            ],
+            "789": [{"name": "M3", "status": "active"}],
+        },
+    )
+
+    assert list(operations) == [
+        {
+            "method": "POST",
+            "path": "/lists/123/members/456/tags",
+            "body": '{"tags": [{"name": "M2", "status": "active"}, {"name": "M1", "status": "inactive"}]}',
+        },
+        {
+            "method": "POST",
+            "path": "/lists/123/members/789/tags",
+            "body": '{"tags": [{"name": "M3", "status": "active"}]}',
+        },
+    ]
+
+
+class TestPackOperations:
+    operations = create_tag_operations(
+        "123", [str(i) for i in range(10)], "tag1", "active"
+    )
+
+    def test_pack_by_number_of_operations(self) -> None:
+        chunks = list(
+            pack_operations(self.operations, max_operations=4, max_payload_bytes=10**6)
+        )
+
+        assert chunks == [
+            self.operations[0:4],
+            self.operations[4:8],
+            self.operations[8:10],
+        ]
+
+    def test_pack_by_payload_bytes(self) -> None:
+        max_payload_bytes = _payload_bytes(self.operations[:3])
+
+        chunks = list(
+            pack_operations(
+                self.operations,
+                max_operations=1000,
+                max_payload_bytes=max_payload_bytes,
+            )
+        )
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+        assert [operation for chunk in chunks for operation in chunk] == self.operations
+        for chunk in chunks:
+            assert _payload_bytes(chunk) <= max_payload_bytes
+
+    def test_pack_everything_into_single_chunk(self) -> None:
+        chunks = list(
+            pack_operations(
+                self.operations,
+                max_operations=10,
+                max_payload_bytes=_payload_bytes(self.operations),
+            )
+        )
+
+        assert chunks == [self.operations]
+
+    def test_pack_no_operations(self) -> None:
+        assert list(pack_operations([], max_operations=10, max_payload_bytes=100)) == []
+
+    def test_pack_raises_if_operation_is_too_large(self) -> None:
+        with pytest.raises(ValueError, match="does not fit into a batch request"):
+            list(
+                pack_operations(
+                    self.operations, max_operations=10, max_payload_bytes=50
+                )
+            )
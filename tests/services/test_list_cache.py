@@ -0,0 +1,61 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from mailchimp_api.config import Config
+from mailchimp_api.services.list_cache import ListIndexCache, create_list_index
+
+
+class TestListIndexCache:
+    config = Config(dc="us14", api_key="anystring")
+
+    def test_get_and_set(self) -> None:
+        cache = ListIndexCache()
+
+        assert cache.get(self.config) is None
+        cache.set(self.config, {"airt": "list_id"})
+        assert cache.get(self.config) == {"airt": "list_id"}
+
+    def test_entries_expire(self) -> None:
+        cache = ListIndexCache()
+        cache.set(self.config, {"airt": "list_id"})
+
+        with patch("mailchimp_api.services.list_cache.time.time") as mock_time:
+            mock_time.return_value = 10**12
+            assert cache.get(self.config) is None
+
+    def test_least_recently_used_entries_are_evicted(self) -> None:
+        cache = ListIndexCache(maxsize=2)
+        configs = [Config(dc="us14", api_key=f"key-{i}") for i in range(3)]
+        for i, config in enumerate(configs):
+            cache.set(config, {"airt": f"list_{i}"})
+
+        assert cache.get(configs[0]) is None
+        assert cache.get(configs[1]) == {"airt": "list_1"}
+        assert cache.get(configs[2]) == {"airt": "list_2"}
+
+    def test_file_is_shared_between_caches(self, tmp_path: Path) -> None:
+        config = Config(
+            dc="us14", api_key="anystring", list_cache_path=tmp_path / "lists.json"
+        )
+        ListIndexCache().set(config, {"airt": "list_id"})
+
+        assert "anystring" not in config.list_cache_path.read_text()  # type: ignore[union-attr]
+        assert ListIndexCache().get(config) == {"airt": "list_id"}
+
+        ListIndexCache().invalidate(config)
+        assert ListIndexCache().get(config) is None
+
+
+def test_create_list_index_keeps_first_list_with_name() -> None:
+    account_lists = {
+        "lists": [
+            {"id": "first_id", "name": "airt"},
+            {"id": "other_id", "name": "other"},
+            {"id": "second_id", "name": "airt"},
+        ]
+    }
+
+    assert create_list_index(account_lists) == {
+        "airt": "first_id",
+        "other": "other_id",
+    }
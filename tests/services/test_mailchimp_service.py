@@ -1,10 +1,24 @@
-from typing import Optional
+import io
+import json
+import tarfile
+from collections.abc import Iterator
+from typing import Any, Optional
 from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
 
 import pytest
+import requests
 
 from mailchimp_api.config import Config
-from mailchimp_api.services.mailchimp_service import MailchimpService
+from mailchimp_api.services.batches import (
+    BatchSubmissionError,
+    Operation,
+    create_tag_operations,
+)
+from mailchimp_api.services.mailchimp_service import (
+    MailchimpService,
+    get_subscriber_hash,
+)
 
 
 class TestMailchimpService:
@@ -18,7 +32,7 @@ class TestMailchimpService:
         self,
         mock_get: MagicMock,
         status_code: int = 200,
-        json_response: Optional[dict[str, str]] = None,
+        json_response: Optional[dict[str, Any]] = None,
     ) -> None:
         if json_response is None:
             json_response = {"status": "success"}
@@ -27,73 +41,303 @@ class TestMailchimpService:
         mock_response.json.return_value = json_response
         mock_get.return_value = mock_response
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.close")
+    def test_session_is_pooled(self, mock_close: MagicMock) -> None:
+        config = Config(dc="us14", api_key="anystring", pool_maxsize=5)
+        with MailchimpService(config=config) as mailchimp_service:
+            session = mailchimp_service.session
+            adapter = session.get_adapter(config.base_url)
+
+            assert session.headers["Authorization"] == "Bearer anystring"
+            assert adapter._pool_maxsize == 5  # type: ignore[attr-defined]
+            assert adapter._pool_block is True  # type: ignore[attr-defined]
+
+        mock_close.assert_called_once()
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_mailchimp_request_get(self, mock_get: MagicMock) -> None:
         self._setup_mailchimp_request_method(mock_get)
         self.mailchimp_service._mailchim_request_get(url="http://test123.com")
 
         mock_get.assert_called_once_with(
             "http://test123.com",
-            headers=self.config.headers,
-            timeout=10,
+            timeout=self.config.timeout,
         )
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_get_account_lists(self, mock_get: MagicMock) -> None:
         self._setup_mailchimp_request_method(mock_get)
         self.mailchimp_service.get_account_lists()
 
         mock_get.assert_called_once_with(
-            f"{self.config.base_url}/lists?fields=lists.id,lists.name",
-            headers=self.config.headers,
-            timeout=10,
+            f"{self.config.base_url}/lists?fields=lists.id,lists.name,total_items&count=1000&offset=0",
+            timeout=self.config.timeout,
         )
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_account_lists_reads_all_pages(self, mock_get: MagicMock) -> None:
+        account_lists = [{"id": str(i), "name": f"list {i}"} for i in range(1500)]
+
+        def get_page(url: str, **kwargs: Any) -> MagicMock:
+            query = parse_qs(urlparse(url).query)
+            offset, count = int(query["offset"][0]), int(query["count"][0])
+            page = {
+                "lists": account_lists[offset : offset + count],
+                "total_items": len(account_lists),
+            }
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get_page
+
+        assert self.mailchimp_service.get_account_lists() == {"lists": account_lists}
+        assert self.mailchimp_service.get_list_ids(refresh=True)["list 1499"] == "1499"
+        assert mock_get.call_count == 4
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_get_account_lists_with_error(self, mock_get: MagicMock) -> None:
         mock_get.side_effect = [
-            Exception("Error 1"),
-            Exception("Error 2"),
+            requests.ConnectionError("Error 1"),
+            requests.Timeout("Error 2"),
             MagicMock(status_code=200, json=lambda: {"status": "success"}),
         ]
         self.mailchimp_service.get_account_lists()
         assert mock_get.call_count == 3
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_account_lists_does_not_retry_client_errors(
+        self, mock_get: MagicMock
+    ) -> None:
+        mock_response = MagicMock(status_code=404)
+        mock_response.raise_for_status.side_effect = requests.HTTPError(
+            "Not Found", response=mock_response
+        )
+        mock_get.return_value = mock_response
+
+        with pytest.raises(requests.HTTPError, match="Not Found"):
+            self.mailchimp_service.get_account_lists()
+        assert mock_get.call_count == 1
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_account_lists_honors_retry_after(self, mock_get: MagicMock) -> None:
+        mailchimp_service = MailchimpService(
+            config=Config(dc="us14", api_key="throttled-key")
+        )
+        throttled_response = MagicMock(status_code=429, headers={"Retry-After": "0"})
+        throttled_response.raise_for_status.side_effect = requests.HTTPError(
+            "Too Many Requests", response=throttled_response
+        )
+        mock_get.side_effect = [
+            throttled_response,
+            MagicMock(status_code=200, json=lambda: {"status": "success"}),
+        ]
+
+        mailchimp_service.get_account_lists()
+
+        assert mock_get.call_count == 2
+        assert mailchimp_service.scheduler.stats.throttled == 1
+        assert mailchimp_service.scheduler.stats.retries == 1
+
+    @pytest.mark.parametrize("max_concurrent_requests", [1, 10])
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_iter_members_with_tags(
+        self, mock_get: MagicMock, max_concurrent_requests: int
+    ) -> None:
+        self.mailchimp_service.config = Config(
+            dc="us14",
+            api_key="anystring",
+            members_page_size=2,
+            max_concurrent_requests=max_concurrent_requests,
+        )
+        members = [{"id": str(i)} for i in range(5)]
+
+        def get_page(url: str, **kwargs: Any) -> MagicMock:
+            offset = int(parse_qs(urlparse(url).query)["offset"][0])
+            page = {"members": members[offset : offset + 2], "total_items": 5}
+            return MagicMock(status_code=200, json=lambda: page)
+
+        mock_get.side_effect = get_page
+
+        members_pages = list(self.mailchimp_service.iter_members_with_tags("123"))
+
+        assert members_pages == [members[0:2], members[2:4], members[4:5]]
+        assert mock_get.call_count == 3
+        for offset in [0, 2, 4]:
+            mock_get.assert_any_call(
+                f"{self.config.base_url}/lists/123/members?fields=members.id,members.email_address,members.tags.name,total_items&count=2&offset={offset}",
+                timeout=self.config.timeout,
+            )
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_iter_members_with_tags_empty_list(self, mock_get: MagicMock) -> None:
+        self._setup_mailchimp_request_method(
+            mock_get, json_response={"members": [], "total_items": 0}
+        )
+
+        assert list(self.mailchimp_service.iter_members_with_tags("123")) == []
+        assert mock_get.call_count == 1
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_iter_members_with_tags_since_last_changed(
+        self, mock_get: MagicMock
+    ) -> None:
+        self._setup_mailchimp_request_method(
+            mock_get, json_response={"members": [], "total_items": 0}
+        )
+
+        list(
+            self.mailchimp_service.iter_members_with_tags(
+                "123", since_last_changed="2024-10-01T12:00:00+00:00"
+            )
+        )
+
+        mock_get.assert_called_once_with(
+            f"{self.config.base_url}/lists/123/members?fields=members.id,members.email_address,members.tags.name,total_items&count=1000&offset=0&since_last_changed=2024-10-01T12%3A00%3A00%2B00%3A00",
+            timeout=self.config.timeout,
+        )
+
+    def test_get_subscriber_hash(self) -> None:
+        assert (
+            get_subscriber_hash("Urist.McVankab@freddiesjokes.com")
+            == "62eeb292278cc15f5817cb78f7790b08"
+        )
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_iter_members_with_tags_by_email(self, mock_get: MagicMock) -> None:
+        self.mailchimp_service.config = Config(
+            dc="us14", api_key="anystring", members_page_size=2
+        )
+        members = {
+            get_subscriber_hash(email): {"id": email, "email_address": email}
+            for email in ["a@airt.ai", "c@airt.ai"]
+        }
+
+        def get_member(url: str, **kwargs: Any) -> MagicMock:
+            member = members.get(urlparse(url).path.rsplit("/", 1)[-1])
+            if member is None:
+                return MagicMock(status_code=404)
+            return MagicMock(status_code=200, json=lambda: member)
+
+        mock_get.side_effect = get_member
+
+        members_pages = list(
+            self.mailchimp_service.iter_members_with_tags_by_email(
+                "123", ["a@airt.ai", "b@airt.ai", "c@airt.ai"]
+            )
+        )
+
+        assert members_pages == [
+            [{"id": "a@airt.ai", "email_address": "a@airt.ai"}],
+            [{"id": "c@airt.ai", "email_address": "c@airt.ai"}],
+        ]
+        assert mock_get.call_count == 3
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_members_with_tags_decodes_with_orjson(
+        self, mock_get: MagicMock
+    ) -> None:
+        pytest.importorskip("orjson")
+        config = Config(dc="us14", api_key="anystring", json_decoder="orjson")
+        mock_get.return_value = MagicMock(
+            status_code=200,
+            content=b'{"members": [{"id": "a", "tags": [{"name": "M1"}]}], "total_items": 1}',
+        )
+
+        with MailchimpService(config=config) as mailchimp_service:
+            page = mailchimp_service.get_members_with_tags("123", count=1000)
+
+        assert page == {
+            "members": [{"id": "a", "tags": [{"name": "M1"}]}],
+            "total_items": 1,
+        }
+        mock_get.return_value.json.assert_not_called()
+
+    def test_config_rejects_unavailable_json_decoder(self) -> None:
+        with (
+            patch(
+                "mailchimp_api.services.json_decoding.is_orjson_available",
+                return_value=False,
+            ),
+            pytest.raises(ValueError, match="requires the orjson package"),
+        ):
+            Config(dc="us14", api_key="anystring", json_decoder="orjson")
+
+    def test_config_rejects_invalid_members_page_size(self) -> None:
+        with pytest.raises(ValueError, match="members_page_size"):
+            Config(dc="us14", api_key="anystring", members_page_size=1001)
+
+    def test_config_rejects_invalid_max_concurrent_requests(self) -> None:
+        with pytest.raises(ValueError, match="max_concurrent_requests"):
+            Config(dc="us14", api_key="anystring", max_concurrent_requests=11)
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_list_id_is_cached(self, mock_get: MagicMock) -> None:
+        self._setup_mailchimp_request_method(
+            mock_get, json_response={"lists": [{"id": "list_id", "name": "airt"}]}
+        )
+
+        assert self.mailchimp_service.get_list_id("airt") == "list_id"
+        assert MailchimpService(self.config).get_list_id("airt") == "list_id"
+        assert mock_get.call_count == 1
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_list_id_refreshes_cache_on_miss(self, mock_get: MagicMock) -> None:
+        mock_get.side_effect = [
+            MagicMock(
+                status_code=200,
+                json=lambda: {"lists": [{"id": "list_id", "name": "airt"}]},
+            ),
+            MagicMock(
+                status_code=200,
+                json=lambda: {
+                    "lists": [
+                        {"id": "list_id", "name": "airt"},
+                        {"id": "new_list_id", "name": "new"},
+                    ]
+                },
+            ),
+            MagicMock(status_code=200, json=lambda: {"lists": []}),
+        ]
+
+        assert self.mailchimp_service.get_list_id("airt") == "list_id"
+        assert self.mailchimp_service.get_list_id("new") == "new_list_id"
+        with pytest.raises(ValueError, match="List missing not found"):
+            self.mailchimp_service.get_list_id("missing")
+        assert mock_get.call_count == 3
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_get_members(self, mock_get: MagicMock) -> None:
         self._setup_mailchimp_request_method(mock_get)
         self.mailchimp_service.get_members(list_id="123")
 
         mock_get.assert_called_once_with(
             f"{self.config.base_url}/lists/123/members?fields=members.email_address,members.id",
-            headers=self.config.headers,
-            timeout=10,
+            timeout=self.config.timeout,
         )
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.get")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
     def test_get_tags(self, mock_get: MagicMock) -> None:
         self._setup_mailchimp_request_method(mock_get)
         self.mailchimp_service.get_tags(list_id="123", member_id="456")
 
         mock_get.assert_called_once_with(
             f"{self.config.base_url}/lists/123/members/456/tags?fields=tags.name",
-            headers=self.config.headers,
-            timeout=10,
+            timeout=self.config.timeout,
         )
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.post")
-    def test_post_batch_update_members_tag_inner(self, mock_post: MagicMock) -> None:
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    def test_post_batch(self, mock_post: MagicMock) -> None:
         self._setup_mailchimp_request_method(mock_post)
-        self.mailchimp_service._post_batch_update_members_tag(
-            list_id="123",
-            member_ids=["456", "789"],
-            tag_name="tag1",
-            status="active",
+        self.mailchimp_service._post_batch(
+            create_tag_operations(
+                list_id="123",
+                member_ids=["456", "789"],
+                tag_name="tag1",
+                status="active",
+            )
         )
 
         mock_post.assert_called_once_with(
             f"{self.config.base_url}/batches",
-            headers=self.config.headers,
             json={
                 "operations": [
                     {
@@ -108,11 +352,14 @@ class TestMailchimpService:
                     },
                 ]
             },
-            timeout=10,
+            timeout=self.config.timeout,
         )
 
-    @patch("mailchimp_api.services.mailchimp_service.requests.post")
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
     def test_post_batch_update_members_tag(self, mock_post: MagicMock) -> None:
+        self.mailchimp_service.config = Config(
+            dc="us14", api_key="anystring", batch_max_operations=200
+        )
         self._setup_mailchimp_request_method(mock_post)
         # i need 500 member ids
         member_ids = [str(i) for i in range(500)]
@@ -127,7 +374,6 @@ class TestMailchimpService:
         for i in range(0, 500, 200):
             mock_post.assert_any_call(
                 f"{self.config.base_url}/batches",
-                headers=self.config.headers,
                 json={
                     "operations": [
                         {
@@ -138,5 +384,94 @@ class TestMailchimpService:
                         for member_id in member_ids[i : i + 200]
                     ]
                 },
-                timeout=10,
+                timeout=self.config.timeout,
             )
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.post")
+    def test_submit_batches_posts_chunks_as_they_are_produced(
+        self, mock_post: MagicMock
+    ) -> None:
+        self.mailchimp_service.config = Config(
+            dc="us14", api_key="anystring", max_concurrent_requests=1
+        )
+        self._setup_mailchimp_request_method(mock_post, json_response={"id": "id"})
+        posted_before_chunk = []
+
+        def chunks() -> Iterator[list[Operation]]:
+            for i in range(3):
+                posted_before_chunk.append(mock_post.call_count)
+                yield create_tag_operations("123", [str(i)], "M1", "active")
+
+        submission = self.mailchimp_service.submit_batches(chunks())
+
+        assert submission.batch_ids == ["id", "id", "id"]
+        assert posted_before_chunk == [0, 1, 2]
+
+    def test_submit_batches_reports_failed_chunks(self) -> None:
+        chunks = [
+            create_tag_operations("123", [str(i)], "tag1", "active") for i in range(5)
+        ]
+        error = ValueError("chunk 2 failed")
+
+        def post_batch(operations: list[dict[str, str]]) -> dict[str, str]:
+            if operations is chunks[2]:
+                raise error
+            return {"id": f"batch-{operations[0]['path']}"}
+
+        with patch.object(
+            self.mailchimp_service, "_post_batch", side_effect=post_batch
+        ) as mock_post_batch:
+            submission = self.mailchimp_service.submit_batches(chunks)
+
+        assert mock_post_batch.call_count == 5
+        assert submission.batch_ids == [
+            f"batch-/lists/123/members/{i}/tags" for i in [0, 1, 3, 4]
+        ]
+        assert len(submission.failures) == 1
+        assert submission.failures[0].operations is chunks[2]
+        assert submission.failures[0].error is error
+        with pytest.raises(BatchSubmissionError, match="1 batch request"):
+            submission.raise_for_failures()
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_get_batch(self, mock_get: MagicMock) -> None:
+        self._setup_mailchimp_request_method(
+            mock_get, json_response={"id": "batch-1", "status": "finished"}
+        )
+
+        batch = self.mailchimp_service.get_batch("batch-1")
+
+        assert batch == {"id": "batch-1", "status": "finished"}
+        mock_get.assert_called_once_with(
+            f"{self.config.base_url}/batches/batch-1?fields=id,status,total_operations,finished_operations,errored_operations,submitted_at,completed_at,response_body_url",
+            timeout=self.config.timeout,
+        )
+
+    @patch("mailchimp_api.services.mailchimp_service.requests.Session.get")
+    def test_iter_batch_results(self, mock_get: MagicMock) -> None:
+        results = [
+            [{"status_code": 200, "operation_id": None, "response": "{}"}],
+            [{"status_code": 400, "operation_id": None, "response": "{}"}],
+        ]
+        archive_bytes = io.BytesIO()
+        with tarfile.open(fileobj=archive_bytes, mode="w:gz") as archive:
+            for i, result in enumerate(results):
+                content = json.dumps(result).encode()
+                info = tarfile.TarInfo(name=f"{i}.json")
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        archive_bytes.seek(0)
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.raw = archive_bytes
+
+        operation_results = list(
+            self.mailchimp_service.iter_batch_results("https://example.com/results")
+        )
+
+        assert operation_results == [result[0] for result in results]
+        mock_get.assert_called_once_with(
+            "https://example.com/results",
+            headers={"Authorization": None},
+            stream=True,
+            timeout=self.config.timeout,
+        )
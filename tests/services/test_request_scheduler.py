@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+import requests
+
+from mailchimp_api.services.request_scheduler import (
+    RequestScheduler,
+    get_retry_after,
+    is_retryable,
+)
+
+
+class TestRequestScheduler:
+    def test_reserve_allows_burst_then_paces_requests(self) -> None:
+        scheduler = RequestScheduler(requests_per_second=10, max_in_flight=3)
+
+        waits = [scheduler.reserve() for _ in range(5)]
+
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] == pytest.approx(0.1, abs=0.01)
+        assert waits[4] == pytest.approx(0.2, abs=0.01)
+        assert scheduler.stats.requests == 5
+
+    def test_record_throttled_pauses_requests(self) -> None:
+        scheduler = RequestScheduler(requests_per_second=10, max_in_flight=3)
+
+        scheduler.record_throttled(retry_after=5)
+
+        assert scheduler.reserve() == pytest.approx(5, abs=0.01)
+        assert scheduler.stats.throttled == 1
+
+    def test_threads_and_event_loop_share_in_flight_slots(self) -> None:
+        scheduler = RequestScheduler(requests_per_second=1000, max_in_flight=2)
+        in_flight = 0
+        max_in_flight = 0
+        lock = threading.Lock()
+
+        def enter() -> None:
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+
+        def leave() -> None:
+            nonlocal in_flight
+            with lock:
+                in_flight -= 1
+
+        def send_sync() -> None:
+            with scheduler.slot():
+                enter()
+                time.sleep(0.01)
+                leave()
+
+        async def send_async() -> None:
+            async with scheduler.async_slot():
+                enter()
+                await asyncio.sleep(0.01)
+                leave()
+
+        async def send_all_async() -> None:
+            await asyncio.gather(*(send_async() for _ in range(5)))
+
+        threads = [threading.Thread(target=send_sync) for _ in range(5)]
+        threads.append(threading.Thread(target=asyncio.run, args=(send_all_async(),)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max_in_flight <= 2
+        assert scheduler.stats.requests == 10
+
+    def test_for_api_key_shares_scheduler(self) -> None:
+        scheduler = RequestScheduler.for_api_key("shared-key", 10, 3)
+
+        assert RequestScheduler.for_api_key("shared-key", 20, 5) is scheduler
+        assert RequestScheduler.for_api_key("other-key", 10, 3) is not scheduler
+
+
+@pytest.mark.parametrize(
+    ("exception", "expected"),
+    [
+        (requests.ConnectionError(), True),
+        (requests.Timeout(), True),
+        (requests.HTTPError(response=MagicMock(status_code=429)), True),
+        (requests.HTTPError(response=MagicMock(status_code=503)), True),
+        (requests.HTTPError(response=MagicMock(status_code=400)), False),
+        (requests.HTTPError(response=MagicMock(status_code=404)), False),
+        (httpx.ConnectError("error"), True),
+        (
+            httpx.HTTPStatusError(
+                "error", request=MagicMock(), response=MagicMock(status_code=502)
+            ),
+            True,
+        ),
+        (
+            httpx.HTTPStatusError(
+                "error", request=MagicMock(), response=MagicMock(status_code=401)
+            ),
+            False,
+        ),
+        (ValueError("error"), False),
+    ],
+)
+def test_is_retryable(exception: BaseException, expected: bool) -> None:
+    assert is_retryable(exception) is expected
+
+
+def test_get_retry_after() -> None:
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    assert get_retry_after(MagicMock(headers={"Retry-After": "12"})) == 12
+    assert get_retry_after(
+        MagicMock(headers={"Retry-After": format_datetime(retry_at)})
+    ) == pytest.approx(30, abs=2)
+    assert get_retry_after(MagicMock(headers={})) is None
+    assert get_retry_after(MagicMock(headers={"Retry-After": "soon"})) is None
+    assert get_retry_after(None) is None
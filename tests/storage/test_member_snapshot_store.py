@@ -0,0 +1,77 @@
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+from mailchimp_api.storage.member_snapshot_store import MemberSnapshotStore
+
+
+def _member(member_id: str, *tags: str) -> dict[str, Any]:
+    return {
+        "id": member_id,
+        "email_address": f"{member_id}@example.com",
+        "tags": [{"id": i, "name": tag} for i, tag in enumerate(tags)],
+    }
+
+
+def test_sync_downloads_changed_members_only(tmp_path: Path) -> None:
+    mailchimp_service = MagicMock()
+    mailchimp_service.iter_members_with_tags.return_value = iter(
+        [[_member("a", "M1"), _member("b")], [_member("c", "M2")]]
+    )
+
+    with MemberSnapshotStore.for_list(tmp_path, "123") as snapshot_store:
+        assert snapshot_store.last_synced_at is None
+        assert snapshot_store.sync(mailchimp_service, "123") == 3
+        last_synced_at = snapshot_store.last_synced_at
+        assert last_synced_at is not None
+
+    mailchimp_service.iter_members_with_tags.assert_called_once_with(
+        "123", since_last_changed=None
+    )
+
+    mailchimp_service.iter_members_with_tags.return_value = iter([[_member("a", "M2")]])
+    with MemberSnapshotStore.for_list(tmp_path, "123") as snapshot_store:
+        assert snapshot_store.sync(mailchimp_service, "123") == 1
+
+        mailchimp_service.iter_members_with_tags.assert_called_with(
+            "123", since_last_changed=last_synced_at
+        )
+        assert list(snapshot_store.iter_members(page_size=2)) == [
+            [_member("a", "M2"), _member("b")],
+            [_member("c", "M2")],
+        ]
+
+
+def test_snapshots_are_kept_per_list(tmp_path: Path) -> None:
+    with MemberSnapshotStore.for_list(tmp_path, "123") as snapshot_store:
+        snapshot_store.upsert_members([_member("a")])
+
+    with MemberSnapshotStore.for_list(tmp_path, "456") as snapshot_store:
+        assert list(snapshot_store.iter_members(page_size=10)) == []
+
+
+def test_apply_tag_changes(tmp_path: Path) -> None:
+    with MemberSnapshotStore.for_list(tmp_path, "123") as snapshot_store:
+        snapshot_store.upsert_members(
+            [_member("a", "M1", "newsletter"), _member("b", "M2")]
+        )
+        snapshot_store.apply_tag_changes(
+            {
+                "a": [
+                    {"name": "M2", "status": "active"},
+                    {"name": "M1", "status": "inactive"},
+                ],
+                "missing": [{"name": "M2", "status": "active"}],
+            }
+        )
+
+        assert list(snapshot_store.iter_members(page_size=10)) == [
+            [
+                {
+                    "id": "a",
+                    "email_address": "a@example.com",
+                    "tags": [{"id": 1, "name": "newsletter"}, {"name": "M2"}],
+                },
+                _member("b", "M2"),
+            ]
+        ]
@@ -0,0 +1,69 @@
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from mailchimp_api.upload_sessions import UploadSessionRegistry
+
+
+def test_create_issues_unique_ids() -> None:
+    upload_sessions = UploadSessionRegistry()
+
+    session_ids = {upload_sessions.create().id for _ in range(100)}
+
+    assert len(session_ids) == 100
+
+
+def test_wait_returns_file_handed_over_in_memory(tmp_path: Path) -> None:
+    upload_sessions = UploadSessionRegistry(poll_interval=60)
+    session = upload_sessions.create()
+    file = BytesIO(b"email\n")
+
+    start = time.monotonic()
+    threading.Timer(0.1, upload_sessions.complete, args=(session.id, file)).start()
+
+    assert (
+        upload_sessions.wait(session.id, tmp_path / "missing.csv", timeout=10) is file
+    )
+    assert time.monotonic() - start < 5
+    assert session.state == "uploaded"
+    assert not upload_sessions.complete(session.id, BytesIO())
+
+    upload_sessions.close(session.id)
+    assert file.closed
+    assert upload_sessions.get(session.id) is None
+
+
+def test_wait_notices_file_saved_by_another_process(tmp_path: Path) -> None:
+    upload_sessions = UploadSessionRegistry(poll_interval=0.05)
+    session = upload_sessions.create()
+    path = tmp_path / "uploaded-file.csv"
+    # the file is renamed into place once written, as the upload endpoint does
+    part_path = tmp_path / "uploaded-file.csv.part"
+    part_path.write_text("email\n")
+    threading.Timer(0.1, part_path.rename, args=(path,)).start()
+
+    file = upload_sessions.wait(session.id, path, timeout=10)
+
+    assert file is not None
+    with file:
+        assert file.read() == b"email\n"
+
+
+def test_wait_times_out(tmp_path: Path) -> None:
+    upload_sessions = UploadSessionRegistry(poll_interval=0.05)
+    session = upload_sessions.create()
+
+    assert (
+        upload_sessions.wait(session.id, tmp_path / "missing.csv", timeout=0.1) is None
+    )
+
+
+def test_complete_unknown_session() -> None:
+    upload_sessions = UploadSessionRegistry()
+
+    assert not upload_sessions.complete("unknown", BytesIO())
+    with pytest.raises(ValueError, match="not found"):
+        upload_sessions.wait("unknown", Path("missing.csv"), timeout=0)
@@ -1,8 +1,10 @@
+from io import BytesIO
 from unittest.mock import MagicMock, call, patch
 
-import pandas as pd
-
-from mailchimp_api.workflow import wf
+from mailchimp_api.processing.update_tags import ListUpdateSummary
+from mailchimp_api.services.batch_tracker import BatchReport, BatchResult
+from mailchimp_api.upload_sessions import upload_sessions
+from mailchimp_api.workflow import _wait_for_file, wf
 
 
 def test_workflow() -> None:
@@ -13,7 +15,7 @@ def test_workflow() -> None:
     with (
         patch(
             "mailchimp_api.workflow._wait_for_file",
-            return_value=pd.DataFrame({"email": ["email1@gmail.com"]}),
+            return_value={"email1@gmail.com"},
         ) as mock_wait_for_file,
         patch("mailchimp_api.workflow.update_tags") as mock_update_tags,
     ):
@@ -50,3 +52,144 @@ def test_workflow() -> None:
         assert ui.text_message.call_args_list[1] == expected_call_args
 
     assert result is not None
+
+
+def test_workflow_reports_batch_results() -> None:
+    ui = MagicMock()
+    ui.text_message.return_value = None
+    ui.text_input.return_value = "test-list"
+
+    with (
+        patch(
+            "mailchimp_api.workflow._wait_for_file",
+            return_value={"email1@gmail.com"},
+        ),
+        patch(
+            "mailchimp_api.workflow.update_tags",
+            return_value=({"M2": ["a"]}, {"M1": ["a"]}),
+        ),
+        patch("mailchimp_api.workflow.BatchTracker") as mock_batch_tracker,
+    ):
+        mock_batch_tracker.return_value.wait.return_value = BatchReport(
+            [
+                BatchResult(
+                    id="batch-1",
+                    status="finished",
+                    total_operations=3,
+                    finished_operations=3,
+                    errored_operations=1,
+                ),
+                BatchResult(id="batch-2", status="started", total_operations=2),
+            ]
+        )
+        wf.run(name="mailchimp_chat", ui=ui)
+
+    expected_body = """Mailchimp batch results:
+
+- **Finished operations**: 3 of 5
+- **Errored operations**: 1
+- **Unfinished batches**: 1
+"""
+    assert ui.text_message.call_args_list[2] == call(
+        sender="Workflow",
+        recipient="User",
+        body=expected_body,
+    )
+
+
+def test_workflow_stops_when_upload_times_out() -> None:
+    ui = MagicMock()
+
+    with (
+        patch("mailchimp_api.workflow._wait_for_file", return_value=None),
+        patch("mailchimp_api.workflow.update_tags") as mock_update_tags,
+    ):
+        result = wf.run(name="mailchimp_chat", ui=ui)
+
+    assert result == "File upload timed out"
+    mock_update_tags.assert_not_called()
+
+
+def test_wait_for_file_reads_file_handed_over_in_memory() -> None:
+    session = upload_sessions.create()
+    upload_sessions.complete(session.id, BytesIO(b"email\nEmail1@gmail.com\n"))
+
+    assert _wait_for_file(session.id) == {"email1@gmail.com"}
+    assert upload_sessions.get(session.id) is None
+
+
+def test_workflow_updates_several_lists() -> None:
+    ui = MagicMock()
+    ui.text_input.return_value = "first, second"
+
+    with (
+        patch(
+            "mailchimp_api.workflow._wait_for_file",
+            return_value={"email1@gmail.com"},
+        ),
+        patch("mailchimp_api.workflow.update_tags_for_lists") as mock_update_tags,
+    ):
+        mock_update_tags.return_value = [
+            ListUpdateSummary(list_name="first", add_tag_members={"M2": ["a"]}),
+            ListUpdateSummary(list_name="second", error="Request failed"),
+        ]
+        result = wf.run(name="mailchimp_chat", ui=ui)
+
+    assert mock_update_tags.call_args.kwargs["list_names"] == ["first", "second"]
+    assert ui.text_message.call_args_list[1].kwargs["body"] == (
+        """Number of updates per tag in **first**:
+
+- **M2**: 1
+
+Number of updates per tag in **second**:
+
+Failed: Request failed
+
+(It might take some time for updates to reflect in Mailchimp)
+"""
+    )
+    assert result == "Task Completed"
+
+
+def test_workflow_dry_run() -> None:
+    ui = MagicMock()
+    ui.text_input.side_effect = ["first", "yes", "no"]
+
+    with (
+        patch(
+            "mailchimp_api.workflow._wait_for_file",
+            return_value={"email1@gmail.com"},
+        ),
+        patch("mailchimp_api.workflow.update_tags_for_lists") as mock_update_tags,
+        patch("mailchimp_api.workflow.update_tags") as mock_update_tags_single,
+    ):
+        mock_update_tags.return_value = [
+            ListUpdateSummary(
+                list_name="first",
+                add_tag_members={"M2": ["a", "b", "c", "d"], "M3": ["e"]},
+                remove_tag_members={"M1": ["a", "b", "c", "d"], "M2": ["e"]},
+                operations=5,
+                batch_requests=1,
+            )
+        ]
+        result = wf.run(name="mailchimp_chat", ui=ui)
+
+    assert mock_update_tags.call_args.kwargs["dry_run"] is True
+    mock_update_tags_single.assert_not_called()
+    assert ui.text_message.call_args_list[1].kwargs["body"] == (
+        """Dry run for **first**:
+
+Tags to add:
+
+- **M2**: 4 (a, b, c, ...)
+- **M3**: 1 (e)
+
+Tags to remove:
+
+- **M1**: 4 (a, b, c, ...)
+- **M2**: 1 (e)
+
+Estimated `/batches` requests: 1 with 5 operations
+"""
+    )
+    assert result == "Dry run completed"